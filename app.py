@@ -8,10 +8,16 @@ from flask import Flask, request, jsonify, render_template, Response, stream_wit
 from flask_cors import CORS
 import sys
 import os
-import json
+import re
+import orjson
 import queue
 import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import requests as http_requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -25,6 +31,12 @@ sys.path.insert(0, SCRIPTS_DIR)
 # Required for qdrant_medical_db relative path used in search_qdrant.py
 os.chdir(PROJECT_ROOT)
 
+import search_qdrant
+import medgemma_query
+import endpoint_warmup
+from semantic_cache import SemanticCache
+from query_cache import QueryCache
+
 app = Flask(__name__)
 CORS(app)
 
@@ -33,16 +45,49 @@ USE_HF_ENDPOINT = bool(os.getenv('MEDGEMMA_CLOUD_ENDPOINT'))
 MEDGEMMA_ENDPOINT = os.getenv('MEDGEMMA_CLOUD_ENDPOINT', '').rstrip('/')
 HF_TOKEN = os.getenv('HF_TOKEN', '')
 
+HF_HEADERS = {
+    "Authorization": f"Bearer {HF_TOKEN}",
+    "Content-Type": "application/json"
+}
+
+# Shared keep-alive connection pool for MedGemma / SapBERT / Ollama calls
+HTTP_SESSION = http_requests.Session()
+_adapter = HTTPAdapter(pool_connections=20, pool_maxsize=50, max_retries=Retry(total=2, backoff_factor=0.2))
+HTTP_SESSION.mount('https://', _adapter)
+HTTP_SESSION.mount('http://', _adapter)
+
+# Shared workers for blocking retrieval / Map-Reduce steps (reused across requests)
+WORKER_POOL = ThreadPoolExecutor(max_workers=int(os.getenv('WORKER_POOL_SIZE', '32')))
+
 # Fallback to local Ollama if HF not configured
 OLLAMA_URL = os.getenv('OLLAMA_URL', 'http://localhost:11434/api/generate')
 OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'medgemma')
 OLLAMA_OPTIONS = {'num_ctx': 8192, 'temperature': 0.1, 'num_predict': 2048}
 
+# Hiragana / Katakana / CJK ideographs
+JAPANESE_RE = re.compile(r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]')
+
+# Retrieval cache: English search query -> (papers, atomic facts)
+RETRIEVAL_CACHE_TTL = int(os.getenv('RETRIEVAL_CACHE_TTL', '600'))
+RETRIEVAL_CACHE = QueryCache(
+    max_size=int(os.getenv('RETRIEVAL_CACHE_SIZE', '512')),
+    ttl_seconds=RETRIEVAL_CACHE_TTL,
+)
+
+# Semantic answer cache (rag / compare only; keyed by the E5 embedding of the English query)
+# Raw E5 similarities sit high even for unrelated questions, so only near-identical wording may hit
+SEMANTIC_CACHE = SemanticCache(
+    threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.95')),
+    max_entries=int(os.getenv('SEMANTIC_CACHE_SIZE', '500')),
+    ttl_seconds=RETRIEVAL_CACHE_TTL,
+)
 
-def build_direct_prompt(query: str) -> str:
-    return f"""Answer the following medical question to the best of your ability. Be concise and focus on evidence-based information.
 
-Question: {query}
+# Static parts of the direct-answer prompt (only the question varies)
+_DIRECT_PROMPT_PRE = """Answer the following medical question to the best of your ability. Be concise and focus on evidence-based information.
+
+Question: """
+_DIRECT_PROMPT_POST = """
 
 Provide a structured answer with:
 1. Main finding
@@ -53,16 +98,16 @@ Provide a structured answer with:
 Answer:"""
 
 
+def build_direct_prompt(query: str) -> str:
+    return _DIRECT_PROMPT_PRE + query + _DIRECT_PROMPT_POST
+
+
 
 def stream_ollama(prompt: str):
     """Generator: yields tokens from MedGemma (HF Endpoint or local Ollama)."""
     if USE_HF_ENDPOINT:
         # Use HF Dedicated Endpoint (OpenAI-compatible streaming)
         endpoint = f"{MEDGEMMA_ENDPOINT}/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {HF_TOKEN}",
-            "Content-Type": "application/json"
-        }
         payload = {
             "model": "tgi",
             "messages": [{"role": "user", "content": prompt}],
@@ -71,28 +116,27 @@ def stream_ollama(prompt: str):
             "stream": True
         }
         
-        resp = http_requests.post(endpoint, headers=headers, json=payload, stream=True, timeout=180)
+        resp = HTTP_SESSION.post(endpoint, headers=HF_HEADERS, json=payload, stream=True, timeout=180)
         resp.raise_for_status()
+
+        # chunk_size=None: split whatever bytes have arrived (no 512-byte reads, no decode)
         
-        for line in resp.iter_lines():
-            if line:
-                line_str = line.decode('utf-8')
-                if line_str.startswith('data: '):
-                    data_str = line_str[6:]  # Remove "data: " prefix
-                    if data_str.strip() == '[DONE]':
-                        break
-                    try:
-                        chunk = json.loads(data_str)
-                        if 'choices' in chunk and len(chunk['choices']) > 0:
-                            delta = chunk['choices'][0].get('delta', {})
-                            token = delta.get('content', '')
-                            if token:
-                                yield token
-                    except json.JSONDecodeError:
-                        continue
+        for line in resp.iter_lines(chunk_size=None):
+            # Skip keep-alive / empty / comment lines on the raw bytes
+            if not line.startswith(b'data: '):
+                continue
+            data = line[6:]  # Remove "data: " prefix (orjson parses bytes directly)
+            if data == b'[DONE]':
+                break
+            try:
+                token = orjson.loads(data)['choices'][0]['delta'].get('content')
+            except (orjson.JSONDecodeError, KeyError, IndexError, TypeError):
+                continue
+            if token:
+                yield token
     else:
         # Fallback to local Ollama
-        resp = http_requests.post(
+        resp = HTTP_SESSION.post(
             OLLAMA_URL,
             json={
                 'model': OLLAMA_MODEL,
@@ -104,9 +148,9 @@ def stream_ollama(prompt: str):
             timeout=120,
         )
         resp.raise_for_status()
-        for line in resp.iter_lines():
+        for line in resp.iter_lines(chunk_size=None):
             if line:
-                chunk = json.loads(line)
+                chunk = orjson.loads(line)
                 token = chunk.get('response', '')
                 if token:
                     yield token
@@ -114,9 +158,153 @@ def stream_ollama(prompt: str):
                     break
 
 
-def sse(payload: dict) -> str:
-    """Format a dict as a Server-Sent Event data line."""
-    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+def relay_progress(work, idle_message: str):
+    """
+    Run work(progress_cb) on the shared worker pool and relay its progress.
+
+    Generator: yields SSE progress payloads while the work runs (idle_message
+    every 15s of silence) and returns the work's result, so callers use
+    `result = yield from relay_progress(...)`. Exceptions are re-raised.
+    """
+    updates = queue.Queue()
+    future = WORKER_POOL.submit(work, updates.put)
+    future.add_done_callback(lambda _: updates.put(None))
+    while True:
+        try:
+            message = updates.get(timeout=15)
+        except queue.Empty:
+            yield {'type': 'progress', 'message': idle_message}
+            continue
+        if message is None:
+            break
+        yield {'type': 'progress', 'message': message}
+    return future.result()
+
+
+class BackgroundStream:
+    """
+    Run stream_ollama(prompt) on the shared worker pool, buffering its tokens.
+
+    Iterating yields the tokens in order (blocking until they arrive) and
+    re-raises the producer's exception. tokens(idle_timeout) also yields None
+    once whenever idle_timeout seconds pass after a token without the next
+    one (so the caller can flush). cancel() stops generation early.
+    """
+
+    def __init__(self, prompt: str):
+        self._tokens = queue.Queue()
+        self._cancelled = threading.Event()
+        WORKER_POOL.submit(self._produce, prompt)
+
+    def _produce(self, prompt):
+        try:
+            for token in stream_ollama(prompt):
+                if self._cancelled.is_set():
+                    break
+                self._tokens.put(token)
+        except Exception as exc:
+            self._tokens.put(exc)
+        finally:
+            self._tokens.put(None)
+
+    def __iter__(self):
+        return self.tokens()
+
+    def tokens(self, idle_timeout=None):
+        """Generator: yield tokens in order, and None once per idle gap of idle_timeout after a token."""
+        timeout = None  # nothing to flush before the first token (e.g. endpoint cold start)
+        while True:
+            try:
+                item = self._tokens.get(timeout=timeout)
+            except queue.Empty:
+                timeout = None
+                yield None
+                continue
+            timeout = idle_timeout
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def cancel(self):
+        self._cancelled.set()
+
+
+# Pre-encoded frame prefixes for the per-token hot path
+_TOKEN_FRAME_PREFIXES = {
+    event_type: b'data: {"type":"' + event_type.encode() + b'","token":'
+    for event_type in ('token', 'rag_token', 'direct_token')
+}
+
+
+def sse(payload: dict) -> bytes:
+    """Format a dict as a Server-Sent Event data line (UTF-8 bytes)."""
+    if len(payload) == 2 and 'token' in payload:
+        prefix = _TOKEN_FRAME_PREFIXES.get(payload['type'])
+        if prefix is not None:
+            return prefix + orjson.dumps(payload['token']) + b'}\n\n'
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+
+# Longest a buffered SSE frame waits before it is flushed (seconds)
+SSE_FLUSH_DELAY = 0.02
+# Yielded by answer_events() when MedGemma has no token ready: flush buffered frames now
+FLUSH_EVENT = {'type': 'flush'}
+
+
+class SseBuffer:
+    """
+    Coalesce SSE frames into fewer HTTP chunks.
+
+    Frames are held until >= max_bytes are buffered, max_delay seconds have
+    passed since the last flush, or a forced frame (progress / context /
+    references / done / error) arrives. Token frames are the ones batched.
+    add() only runs when a frame arrives, so the producer yields FLUSH_EVENT
+    whenever upstream has had nothing ready for SSE_FLUSH_DELAY seconds; a
+    buffered token therefore never waits on the next one.
+    """
+
+    FORCE_TYPES = frozenset({'progress', 'context', 'references', 'done', 'error'})
+
+    def __init__(self, max_bytes=4096, max_delay=SSE_FLUSH_DELAY):
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self._frames = []
+        self._size = 0
+        self._last_flush = time.monotonic()
+
+    def add(self, frame: bytes, force=False):
+        """Generator: buffer one frame, yielding the combined chunk when a flush is due."""
+        self._frames.append(frame)
+        self._size += len(frame)
+        if force or self._size >= self.max_bytes or time.monotonic() - self._last_flush >= self.max_delay:
+            yield from self.flush()
+
+    def flush(self):
+        """Generator: yield everything buffered so far as one chunk."""
+        if self._frames:
+            chunk = b''.join(self._frames)
+            self._frames.clear()
+            self._size = 0
+            yield chunk
+        self._last_flush = time.monotonic()
+
+
+def paper_view(paper: dict, include_score=False, include_abstract=False) -> dict:
+    """Paper summary sent to the browser in context / references events."""
+    metadata = paper.get('metadata', {})
+    view = {
+        'paper_id': paper.get('paper_id', ''),
+        'title': metadata.get('title', ''),
+        'journal': metadata.get('journal', ''),
+        'year': metadata.get('publication_year', ''),
+    }
+    if include_score:
+        view['score'] = round(float(paper.get('score', 0)), 3)
+    if include_abstract:
+        view['abstract'] = paper.get('abstract', '')
+    return view
 
 
 # ── Routes ────────────────────────────────────────────────────────────────────
@@ -126,60 +314,51 @@ def index():
     return render_template('index.html')
 
 
-@app.route('/api/status')
-def status():
-    """Return connectivity status of cloud APIs (Qdrant Cloud, HF Endpoints, OpenRouter)."""
-    result = {}
-    
-    # Qdrant Cloud
+def _probe_qdrant():
     try:
-        import search_qdrant
-        qdrant_client, mode = search_qdrant.initialize_qdrant_client(force_cloud=True)
+        qdrant_client, mode = search_qdrant.get_qdrant_client()
         collections = [c.name for c in qdrant_client.get_collections().collections]
-        result['qdrant_cloud'] = {'ok': True, 'collections': collections, 'mode': mode}
+        return 'qdrant_cloud', {'ok': True, 'collections': collections, 'mode': mode}
     except Exception as exc:
-        result['qdrant_cloud'] = {'ok': False, 'error': str(exc)}
-    
+        return 'qdrant_cloud', {'ok': False, 'error': str(exc)}
+
+
+def _probe_openrouter():
     # OpenRouter API (E5 embeddings)
     try:
-        import search_qdrant
         test_embedding = search_qdrant.encode_via_openrouter("test query")
-        result['openrouter_api'] = {'ok': True, 'embedding_dim': len(test_embedding)}
+        return 'openrouter_api', {'ok': True, 'embedding_dim': len(test_embedding)}
     except Exception as exc:
-        result['openrouter_api'] = {'ok': False, 'error': str(exc)}
-    
+        return 'openrouter_api', {'ok': False, 'error': str(exc)}
+
+
+def _probe_sapbert():
     # HF Dedicated Endpoint (SapBERT embeddings) - fast probe, no retries
     sapbert_endpoint = os.getenv('SAPBERT_ENDPOINT')
-    if sapbert_endpoint and HF_TOKEN:
-        try:
-            test_resp = http_requests.post(
-                sapbert_endpoint,
-                headers={
-                    "Authorization": f"Bearer {HF_TOKEN}",
-                    "Content-Type": "application/json"
-                },
-                json={"inputs": "test"},
-                timeout=10
-            )
-            if test_resp.status_code == 200:
-                result['sapbert_endpoint'] = {'ok': True, 'status': 'ready'}
-            else:
-                result['sapbert_endpoint'] = {'ok': True, 'status': 'sleeping'}
-        except Exception:
-            result['sapbert_endpoint'] = {'ok': True, 'status': 'sleeping'}
-    else:
-        result['sapbert_endpoint'] = {'ok': False, 'status': 'sleeping', 'configured': False}
-    
+    if not (sapbert_endpoint and HF_TOKEN):
+        return 'sapbert_endpoint', {'ok': False, 'status': 'sleeping', 'configured': False}
+    try:
+        test_resp = HTTP_SESSION.post(
+            sapbert_endpoint,
+            headers=HF_HEADERS,
+            json={"inputs": "test"},
+            timeout=10
+        )
+        if test_resp.status_code == 200:
+            return 'sapbert_endpoint', {'ok': True, 'status': 'ready'}
+    except Exception:
+        pass
+    return 'sapbert_endpoint', {'ok': True, 'status': 'sleeping'}
+
+
+def _probe_medgemma():
     # MedGemma HF Endpoint (test actual connectivity)
     if USE_HF_ENDPOINT and MEDGEMMA_ENDPOINT:
         try:
             test_endpoint = f"{MEDGEMMA_ENDPOINT}/v1/chat/completions"
-            test_resp = http_requests.post(
+            test_resp = HTTP_SESSION.post(
                 test_endpoint,
-                headers={
-                    "Authorization": f"Bearer {HF_TOKEN}",
-                    "Content-Type": "application/json"
-                },
+                headers=HF_HEADERS,
                 json={
                     "model": "tgi",
                     "messages": [{"role": "user", "content": "test"}],
@@ -188,16 +367,24 @@ def status():
                 timeout=10
             )
             if test_resp.status_code == 200:
-                result['medgemma_endpoint'] = {'ok': True, 'status': 'ready'}
-            else:
-                result['medgemma_endpoint'] = {'ok': True, 'status': 'sleeping'}
+                return 'medgemma_endpoint', {'ok': True, 'status': 'ready'}
         except Exception:
-            result['medgemma_endpoint'] = {'ok': True, 'status': 'sleeping'}
+            pass
+        return 'medgemma_endpoint', {'ok': True, 'status': 'sleeping'}
     elif MEDGEMMA_ENDPOINT:
-        result['medgemma_endpoint'] = {'ok': True, 'configured': True, 'endpoint': MEDGEMMA_ENDPOINT}
-    else:
-        result['medgemma_endpoint'] = {'ok': False, 'configured': False, 'note': 'Using local Ollama fallback'}
-    
+        return 'medgemma_endpoint', {'ok': True, 'configured': True, 'endpoint': MEDGEMMA_ENDPOINT}
+    return 'medgemma_endpoint', {'ok': False, 'configured': False, 'note': 'Using local Ollama fallback'}
+
+
+STATUS_PROBES = (_probe_qdrant, _probe_openrouter, _probe_sapbert, _probe_medgemma)
+
+
+@app.route('/api/status')
+def status():
+    """Return connectivity status of cloud APIs (Qdrant Cloud, HF Endpoints, OpenRouter)."""
+    # Probes are independent -- run them concurrently so wall time is max(probe)
+    with ThreadPoolExecutor(max_workers=len(STATUS_PROBES)) as executor:
+        result = dict(executor.map(lambda probe: probe(), STATUS_PROBES))
     return jsonify(result)
 
 
@@ -214,9 +401,9 @@ def wakeup():
     sapbert_endpoint = os.getenv('SAPBERT_ENDPOINT')
     if sapbert_endpoint and HF_TOKEN:
         try:
-            resp = http_requests.post(
+            resp = HTTP_SESSION.post(
                 sapbert_endpoint,
-                headers={"Authorization": f"Bearer {HF_TOKEN}", "Content-Type": "application/json"},
+                headers=HF_HEADERS,
                 json={"inputs": "test"},
                 timeout=10
             )
@@ -227,9 +414,9 @@ def wakeup():
     # Ping MedGemma
     if MEDGEMMA_ENDPOINT and HF_TOKEN:
         try:
-            resp = http_requests.post(
+            resp = HTTP_SESSION.post(
                 f"{MEDGEMMA_ENDPOINT}/v1/chat/completions",
-                headers={"Authorization": f"Bearer {HF_TOKEN}", "Content-Type": "application/json"},
+                headers=HF_HEADERS,
                 json={"model": "tgi", "messages": [{"role": "user", "content": "test"}], "max_tokens": 5},
                 timeout=10
             )
@@ -240,6 +427,16 @@ def wakeup():
     return jsonify(results)
 
 
+@app.route('/api/cache/clear', methods=['POST'])
+def clear_cache():
+    """Drop cached collection snapshots, retrieval results and answers (e.g. after re-indexing Qdrant)."""
+    stats = {'retrieval': RETRIEVAL_CACHE.stats(), 'semantic': SEMANTIC_CACHE.stats()}
+    RETRIEVAL_CACHE.clear()
+    SEMANTIC_CACHE.clear()
+    search_qdrant.clear_collection_snapshots()
+    return jsonify({'cleared': True, 'before': stats})
+
+
 @app.route('/api/query', methods=['POST'])
 def query():
     """
@@ -267,235 +464,216 @@ def query():
     if mode not in ('direct', 'rag', 'compare'):
         return jsonify({'error': 'mode は direct / rag / compare のいずれかを指定してください'}), 400
 
-    def generate():
+    # Set by answer_events(): E5 embedding of the English query, and whether it was a cache hit.
+    # Namespaced by query language too: translation events are only emitted for Japanese questions
+    semantic = {
+        'namespace': f"{mode}:{'ja' if JAPANESE_RE.search(query_text) else 'en'}",
+        'embedding': None,
+        'hit': False,
+    }
+
+    def answer_events():
+        direct_stream = None
         try:
-            # Send immediate feedback that connection is established
-            yield sse({'type': 'progress', 'message': 'リクエスト受信、処理開始...'})
-            
             # Initialize variables for bilingual support
-            import re
-            is_japanese = bool(re.search(r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]', query_text))
+            is_japanese = JAPANESE_RE.search(query_text) is not None
             rag_answer_en = None
+            query_en = None  # English query, shared between RAG and direct steps
             
             # ── RAG retrieval (rag or compare) — Map-Reduce architecture ──
             rag_answer = None
             if mode in ('rag', 'compare'):
-                yield sse({'type': 'progress', 'message': '翻訳中...'})
-                import search_qdrant
-                import medgemma_query
+                yield {'type': 'progress', 'message': '翻訳中...'}
 
                 # Step 1: Translate JP → EN
                 search_query = medgemma_query.translate_query(query_text)
+                query_en = search_query
+
+                # Semantic cache: replay a stored answer for the same English question
+                # (the embedding is reused by the paper search through the E5 cache)
+                try:
+                    semantic['embedding'] = search_qdrant.encode_via_openrouter(f"query: {search_query}")
+                    cached_events = SEMANTIC_CACHE.lookup(semantic['namespace'], semantic['embedding'])
+                except Exception:
+                    cached_events = None
+                if cached_events is not None:
+                    semantic['hit'] = True
+                    yield from cached_events
+                    return
+
+                if mode == 'compare':
+                    # Generate the direct answer concurrently with retrieval + Map-Reduce
+                    direct_stream = BackgroundStream(build_direct_prompt(query_en))
 
                 # Step 2: Search papers + atomic facts
-                yield sse({'type': 'progress', 'message': '論文検索中... (初回アクセス時は起動に時間がかかります)'})
-                search_results = search_qdrant.search_medical_papers(search_query, top_k=3)
-                papers = search_results.get('papers', [])
-
-                paper_ids = [p.get('paper_id') for p in papers]
-                # search_atomic_facts をスレッド内で実行し、SapBERT cold start の進捗をSSEで中継
-                _facts_q = queue.Queue()
-                def _facts_thread():
-                    def pcb(msg):
-                        _facts_q.put({'type': 'progress', 'message': msg})
-                    try:
-                        _facts_q.put({'type': 'result', 'value': search_qdrant.search_atomic_facts(
-                            search_query, limit=10, paper_ids=paper_ids, progress_cb=pcb)})
-                    except Exception as e:
-                        _facts_q.put({'type': 'error', 'message': str(e)})
-                    finally:
-                        _facts_q.put({'type': '__done__'})
-                threading.Thread(target=_facts_thread, daemon=True).start()
-                all_facts = []
-                while True:
-                    try:
-                        item = _facts_q.get(timeout=15)
-                    except queue.Empty:
-                        yield sse({'type': 'progress', 'message': 'データベース検索中...'})
-                        continue
-                    if item['type'] == '__done__':
-                        break
-                    elif item['type'] == 'progress':
-                        yield sse({'type': 'progress', 'message': item['message']})
-                    elif item['type'] == 'result':
-                        all_facts = item['value']
-                    elif item['type'] == 'error':
-                        raise RuntimeError(item['message'])
+                yield {'type': 'progress', 'message': '論文検索中... (初回アクセス時は起動に時間がかかります)'}
+                retrieval_key = (search_query, 3)
+                cached_retrieval = RETRIEVAL_CACHE.get(retrieval_key)
+                if cached_retrieval is not None:
+                    papers, all_facts = cached_retrieval
+                else:
+                    # 論文検索(E5) と SapBERT エンコードを並行実行し、SapBERT cold start の進捗をSSEで中継
+                    papers, all_facts = yield from relay_progress(
+                        lambda pcb: search_qdrant.search_papers_and_facts(
+                            search_query, top_k=3, fact_limit=10, progress_cb=pcb),
+                        idle_message='データベース検索中...',
+                    )
+                    if papers:
+                        RETRIEVAL_CACHE.put(retrieval_key, (papers, all_facts))
 
                 context_payload = {
-                    'papers': [
-                        {
-                            'paper_id': p.get('paper_id', ''),
-                            'title': p.get('metadata', {}).get('title', ''),
-                            'journal': p.get('metadata', {}).get('journal', ''),
-                            'year': p.get('metadata', {}).get('publication_year', ''),
-                            'score': round(float(p.get('score', 0)), 3),
-                        }
-                        for p in papers[:3]
-                    ],
+                    'papers': [paper_view(p, include_score=True) for p in papers[:3]],
                     'facts': [f['fact_text'] for f in all_facts[:5]],
                 }
-                yield sse({'type': 'context', 'context': context_payload})
+                yield {'type': 'context', 'context': context_payload}
 
-                # Step 3+4: Map-Reduce phases — threaded to relay SSE progress during MedGemma cold start
-                facts_by_paper = {str(pid): [] for pid in paper_ids}
+                # Step 3+4: Map-Reduce phases — on a worker thread to relay SSE progress during MedGemma cold start
+                # paper_id is normalized to str by search_qdrant
+                facts_by_paper = defaultdict(list)
                 for fact in all_facts:
-                    pid = str(fact.get('paper_id'))
-                    if pid in facts_by_paper:
-                        facts_by_paper[pid].append(fact)
-
-                _mr_q = queue.Queue()
-                def _map_reduce_thread():
-                    def pcb(msg):
-                        _mr_q.put({'type': 'progress', 'message': msg})
-                    try:
-                        _vf, _cp = [], []
-                        for paper in papers:
-                            pid = str(paper.get('paper_id'))
-                            rf = facts_by_paper.get(pid, [])
-                            r = medgemma_query.analyze_single_paper(paper, rf, search_query, progress_cb=pcb)
+                    facts_by_paper[fact['paper_id']].append(fact)
+
+                def _map_reduce(pcb):
+                    # Map: papers are independent, so analyze them concurrently
+                    # (wall time = slowest paper instead of the sum)
+                    _vf, _cp = [], []
+                    if papers:
+                        with ThreadPoolExecutor(max_workers=len(papers)) as map_pool:
+                            futures = [
+                                map_pool.submit(
+                                    medgemma_query.analyze_single_paper, paper,
+                                    facts_by_paper.get(paper['paper_id'], []),
+                                    search_query, progress_cb=pcb)
+                                for paper in papers
+                            ]
+                        # Collect in retrieval order
+                        for paper, future in zip(papers, futures):
+                            r = future.result()
                             if r:
                                 _vf.append(r)
                                 _cp.append(paper)
-                        _mr_q.put({'type': 'progress', 'message': '回答を統合中... (Reduce phase)'})
-                        ans = medgemma_query.synthesize_findings(_vf, search_query, progress_cb=pcb)
-                        _mr_q.put({'type': 'result', 'answer': ans, 'papers': _cp})
-                    except Exception as e:
-                        _mr_q.put({'type': 'error', 'message': str(e)})
-                    finally:
-                        _mr_q.put({'type': '__done__'})
-
-                threading.Thread(target=_map_reduce_thread, daemon=True).start()
-                rag_answer, contributing_papers = None, []
-                while True:
-                    try:
-                        item = _mr_q.get(timeout=15)
-                    except queue.Empty:
-                        yield sse({'type': 'progress', 'message': 'エンドポイント起動待機中...'})
-                        continue
-                    if item['type'] == '__done__':
-                        break
-                    elif item['type'] == 'progress':
-                        yield sse({'type': 'progress', 'message': item['message']})
-                    elif item['type'] == 'result':
-                        rag_answer = item['answer']
-                        contributing_papers = item['papers']
-                    elif item['type'] == 'error':
-                        raise RuntimeError(item['message'])
-
-                # 空回答ガード（raise 後はここに来ないが念のため）
+                    pcb('回答を統合中... (Reduce phase)')
+                    return medgemma_query.synthesize_findings(_vf, search_query, progress_cb=pcb), _cp
+
+                rag_answer, contributing_papers = yield from relay_progress(
+                    _map_reduce, idle_message='エンドポイント起動待機中...')
+
+                # 空回答ガード（例外時はここに来ないが念のため）
                 if not rag_answer:
-                    yield sse({'type': 'error', 'message': 'MedGemmaが応答しませんでした。しばらく後に再試行してください。'})
-                    yield sse({'type': 'done', 'mode': mode})
+                    yield {'type': 'error', 'message': 'MedGemmaが応答しませんでした。しばらく後に再試行してください。'}
+                    yield {'type': 'done', 'mode': mode}
                     return
                 
+                paper_refs = [paper_view(p, include_abstract=True) for p in contributing_papers]
+
                 # Step 5: Store English answer and translate to Japanese if original query was in Japanese
                 rag_answer_en = rag_answer  # Keep English version
                 if is_japanese and rag_answer:
-                    yield sse({'type': 'progress', 'message': '日本語に翻訳中...'})
+                    yield {'type': 'progress', 'message': '日本語に翻訳中...'}
                     rag_answer = medgemma_query.translate_to_japanese(rag_answer)
 
             # ── Compare mode: emit RAG answer then stream direct ──────────
             if mode == 'compare':
-                # Send English version first
-                for line in rag_answer_en.split('\n'):
-                    yield sse({'type': 'rag_token', 'token': line + '\n'})
+                # Send English version first (already complete -- one event, not one per line)
+                yield {'type': 'rag_token', 'token': rag_answer_en if rag_answer_en.endswith('\n') else rag_answer_en + '\n'}
                 # Then send Japanese translation if available
                 if is_japanese and rag_answer != rag_answer_en:
-                    yield sse({'type': 'rag_translation', 'token': rag_answer, 'language': 'japanese'})
-                if contributing_papers:
-                    yield sse({
-                        'type': 'references',
-                        'papers': [
-                            {
-                                'paper_id': p.get('paper_id', ''),
-                                'title': p.get('metadata', {}).get('title', ''),
-                                'journal': p.get('metadata', {}).get('journal', ''),
-                                'year': p.get('metadata', {}).get('publication_year', ''),
-                                'abstract': p.get('abstract', ''),
-                            }
-                            for p in contributing_papers
-                        ]
-                    })
-
-                # Translate query for direct mode if Japanese
-                if is_japanese:
-                    query_en = medgemma_query.translate_query(query_text)
-                else:
-                    query_en = query_text
-                
-                yield sse({'type': 'progress', 'message': '直接回答生成中...'})
-                direct_prompt = build_direct_prompt(query_en)
-                
+                    yield {'type': 'rag_translation', 'token': rag_answer, 'language': 'japanese'}
+                if paper_refs:
+                    yield {'type': 'references', 'papers': paper_refs}
+
+                # Direct answer has been generating in the background since translation
+                yield {'type': 'progress', 'message': '直接回答生成中...'}
+
                 # Collect direct answer
-                direct_answer = ""
-                for token in stream_ollama(direct_prompt):
-                    direct_answer += token
-                    yield sse({'type': 'direct_token', 'token': token})
+                direct_chunks = []
+                for token in direct_stream.tokens(idle_timeout=SSE_FLUSH_DELAY):
+                    if token is None:
+                        yield FLUSH_EVENT
+                        continue
+                    direct_chunks.append(token)
+                    yield {'type': 'direct_token', 'token': token}
+                direct_answer = ''.join(direct_chunks)
                 
                 # Translate back if Japanese
                 if is_japanese and direct_answer:
-                    yield sse({'type': 'progress', 'message': '直接回答を日本語に翻訳中...'})
+                    yield {'type': 'progress', 'message': '直接回答を日本語に翻訳中...'}
                     translated_direct = medgemma_query.translate_to_japanese(direct_answer)
                     # Send Japanese translation alongside English (don't replace)
-                    yield sse({'type': 'direct_translation', 'token': translated_direct, 'language': 'japanese'})
+                    yield {'type': 'direct_translation', 'token': translated_direct, 'language': 'japanese'}
 
-                yield sse({'type': 'done', 'mode': 'compare'})
+                yield {'type': 'done', 'mode': 'compare'}
                 return
 
             # ── Single mode: direct or RAG ────────────────────────────────
             if mode == 'rag':
                 # Send English version first
-                yield sse({'type': 'token', 'token': rag_answer_en})
+                yield {'type': 'token', 'token': rag_answer_en}
                 # Then send Japanese translation if available
                 if is_japanese and rag_answer != rag_answer_en:
-                    yield sse({'type': 'translation', 'token': rag_answer, 'language': 'japanese'})
-                if contributing_papers:
-                    yield sse({
-                        'type': 'references',
-                        'papers': [
-                            {
-                                'paper_id': p.get('paper_id', ''),
-                                'title': p.get('metadata', {}).get('title', ''),
-                                'journal': p.get('metadata', {}).get('journal', ''),
-                                'year': p.get('metadata', {}).get('publication_year', ''),
-                                'abstract': p.get('abstract', ''),
-                            }
-                            for p in contributing_papers
-                        ]
-                    })
+                    yield {'type': 'translation', 'token': rag_answer, 'language': 'japanese'}
+                if paper_refs:
+                    yield {'type': 'references', 'papers': paper_refs}
             else:
                 # Direct mode: translate query if Japanese, then translate answer back
-                import medgemma_query
                 if is_japanese:
-                    yield sse({'type': 'progress', 'message': '翻訳中...'})
+                    yield {'type': 'progress', 'message': '翻訳中...'}
                     query_en = medgemma_query.translate_query(query_text)
                 else:
                     query_en = query_text
                 
-                yield sse({'type': 'progress', 'message': 'MedGemma 生成中... (初回アクセス時は起動に時間がかかります)'})
+                yield {'type': 'progress', 'message': 'MedGemma 生成中... (初回アクセス時は起動に時間がかかります)'}
                 
-                # Collect streaming tokens into a buffer
-                direct_answer = ""
-                for token in stream_ollama(build_direct_prompt(query_en)):
-                    direct_answer += token
-                    yield sse({'type': 'token', 'token': token})
+                # Collect streaming tokens into a buffer (generated on a worker so idle gaps can flush)
+                direct_chunks = []
+                direct_stream = BackgroundStream(build_direct_prompt(query_en))
+                for token in direct_stream.tokens(idle_timeout=SSE_FLUSH_DELAY):
+                    if token is None:
+                        yield FLUSH_EVENT
+                        continue
+                    direct_chunks.append(token)
+                    yield {'type': 'token', 'token': token}
+                direct_answer = ''.join(direct_chunks)
                 
                 # If original query was Japanese, translate answer back
                 if is_japanese and direct_answer:
-                    yield sse({'type': 'progress', 'message': '日本語に翻訳中...'})
+                    yield {'type': 'progress', 'message': '日本語に翻訳中...'}
                     translated = medgemma_query.translate_to_japanese(direct_answer)
                     # Send Japanese translation alongside English (don't replace)
-                    yield sse({'type': 'translation', 'token': translated, 'language': 'japanese'})
+                    yield {'type': 'translation', 'token': translated, 'language': 'japanese'}
 
-            yield sse({'type': 'done', 'mode': mode})
+            yield {'type': 'done', 'mode': mode}
 
         except http_requests.exceptions.ConnectionError:
-            yield sse({'type': 'error', 'message': 'Ollama に接続できません。localhost:11434 が起動しているか確認してください。'})
-            yield sse({'type': 'done', 'mode': mode})
+            yield {'type': 'error', 'message': 'Ollama に接続できません。localhost:11434 が起動しているか確認してください。'}
+            yield {'type': 'done', 'mode': mode}
         except Exception as exc:
-            yield sse({'type': 'error', 'message': str(exc)})
-            yield sse({'type': 'done', 'mode': mode})
+            yield {'type': 'error', 'message': str(exc)}
+            yield {'type': 'done', 'mode': mode}
+        finally:
+            # Stop a background direct answer nobody will read (error / early return / disconnect)
+            if direct_stream is not None:
+                direct_stream.cancel()
+
+    def generate():
+        # Send immediate feedback that connection is established
+        yield sse({'type': 'progress', 'message': 'リクエスト受信、処理開始...'})
+        buf = SseBuffer()
+
+        recorded, failed = [], False
+        for payload in answer_events():
+            if payload is FLUSH_EVENT:
+                yield from buf.flush()
+                continue
+            if payload['type'] == 'error':
+                failed = True
+            elif payload['type'] != 'progress':
+                recorded.append(payload)
+            yield from buf.add(sse(payload), force=payload['type'] in SseBuffer.FORCE_TYPES)
+        yield from buf.flush()
+
+        if semantic['embedding'] is not None and not semantic['hit'] and not failed:
+            SEMANTIC_CACHE.insert(semantic['namespace'], semantic['embedding'], recorded)
 
     return Response(
         stream_with_context(generate()),
@@ -508,6 +686,8 @@ def query():
 
 
 if __name__ == '__main__':
-    # 本番環境: HTTP:8080で起動（Tailscale Funnel proxy経由）
-    print("HTTP:8080でFlaskを起動します...")
+    # 開発用: 本番は gunicorn --config gunicorn.conf.py app:app（run_flask.sh / Dockerfile）
+    print("HTTP:8080でFlask開発サーバーを起動します...")
+    # gunicorn では when_ready フック (gunicorn.conf.py) がインスタンスごとに1回だけ起動する
+    endpoint_warmup.start_endpoint_warmup()
     app.run(host='0.0.0.0', port=8080, debug=False, threaded=True)
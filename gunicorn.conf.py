@@ -0,0 +1,34 @@
+"""
+Gunicorn configuration for the Clinical Evidence Agent web server
+Usage: gunicorn --config gunicorn.conf.py app:app
+
+gthread workers: each SSE stream holds one thread for its whole lifetime,
+so concurrent streams = workers * threads.
+"""
+
+import os
+import sys
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+# gthread by default: /api/query relays work through real threads (shared
+# ThreadPoolExecutor + queue.Queue). An async class (e.g. gevent, installed
+# separately) can be selected for many idle SSE clients per worker.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))  # async workers only
+
+# Map-Reduce answers can take minutes while HF endpoints cold-start
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '600'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '75'))
+graceful_timeout = 30
+
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    """Start the HF endpoint warm-up once per instance (in the master), not once per worker."""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+    import endpoint_warmup
+    endpoint_warmup.start_endpoint_warmup()
@@ -26,7 +26,7 @@ start_flask() {
 
     cd "$SCRIPT_DIR"
 
-    nohup python3 app.py > "$FLASK_LOG" 2>&1 &
+    nohup gunicorn --config gunicorn.conf.py app:app > "$FLASK_LOG" 2>&1 &
     flask_pid=$!
     echo "$flask_pid" > "$FLASK_PID_FILE"
 
@@ -6,9 +6,15 @@ scriptsフォルダに配置して実行することを想定しています。
 """
 
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
 import time
 import os
+import sqlite3
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from xml.etree import ElementTree as ET
 from dotenv import load_dotenv
@@ -19,6 +25,7 @@ from dotenv import load_dotenv
 BASE_DIR = Path(__file__).resolve().parent.parent
 DATA_ROOT = BASE_DIR / "data" / "obesity"
 ENV_PATH = BASE_DIR / ".env"
+PMCID_CACHE_PATH = BASE_DIR / ".cache" / "pmid_pmcid.db"
 
 load_dotenv(ENV_PATH)
 NCBI_API_KEY = os.getenv("NCBI_API_KEY")
@@ -29,15 +36,120 @@ NCBI_API_KEY = os.getenv("NCBI_API_KEY")
 ID_CONV_URL = "https://www.ncbi.nlm.nih.gov/pmc/utils/idconv/v1.0/"
 EFETCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
 EMAIL = "your_email@example.com" 
+ID_CONV_BATCH_SIZE = 200  # ID変換APIの1リクエストあたりのPMID数
 
-SLEEP_TIME = 0.15 if NCBI_API_KEY else 0.4
+# NCBIの上限: APIキーあり 10 req/s, なし 3 req/s
+REQUESTS_PER_SECOND = 10 if NCBI_API_KEY else 3
+MAX_WORKERS = REQUESTS_PER_SECOND
+
+# NCBIへの接続を使い回す (TLSハンドシェイクを毎回行わない) + 一時的なエラーは再試行
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504]),
+))
 
 # ==========================================
 # 関数
 # ==========================================
 
+class RateLimiter:
+    """スライディングウィンドウ方式のレート制限 (スレッドセーフ): period秒あたり最大max_calls回"""
+
+    def __init__(self, max_calls, period=1.0):
+        self.max_calls = max_calls
+        self.period = period
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """送信してよくなるまで待機"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= self.period:
+                    self._calls.popleft()
+                if len(self._calls) < self.max_calls:
+                    self._calls.append(now)
+                    return
+                delay = self.period - (now - self._calls[0])
+            time.sleep(delay)
+
+
+RATE_LIMITER = RateLimiter(REQUESTS_PER_SECOND)
+
+# PMCIDがないPMIDも記録し、一定期間は再問い合わせしない (後からPMCに収載されることがあるため期限付き)
+NO_PMCID_RECHECK_SECONDS = 30 * 24 * 3600
+
+_pmcid_cache = None
+
+
+def get_pmcid_cache():
+    """PMID→PMCID変換結果のディスクキャッシュ (SQLite) を開く。実行をまたいでID変換APIの呼び出しを省く"""
+    global _pmcid_cache
+    if _pmcid_cache is None:
+        PMCID_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _pmcid_cache = sqlite3.connect(PMCID_CACHE_PATH)
+        _pmcid_cache.execute('PRAGMA journal_mode=WAL')
+        _pmcid_cache.execute('PRAGMA synchronous=NORMAL')
+        _pmcid_cache.execute(
+            'CREATE TABLE IF NOT EXISTS m (pmid TEXT PRIMARY KEY, pmcid TEXT, ts INTEGER)'
+        )
+    return _pmcid_cache
+
+
+def get_pmcids_cached(pmids):
+    """
+    キャッシュ済みのPMIDはローカルで解決し、未知のPMIDだけをID変換APIに問い合わせる
+
+    Returns:
+        {pmid(str): pmcid} (PMCIDがないPMIDは含まない)
+    """
+    db = get_pmcid_cache()
+    recheck_before = int(time.time()) - NO_PMCID_RECHECK_SECONDS
+
+    mapping = {}
+    known = set()
+    # SQLiteのバインド変数の上限を超えないよう分割して引く
+    for i in range(0, len(pmids), 500):
+        chunk = pmids[i:i + 500]
+        rows = db.execute(
+            f"SELECT pmid, pmcid, ts FROM m WHERE pmid IN ({','.join('?' * len(chunk))})",
+            chunk,
+        )
+        for pmid, pmcid, ts in rows:
+            if pmcid:
+                mapping[pmid] = pmcid
+                known.add(pmid)
+            elif ts >= recheck_before:
+                known.add(pmid)
+
+    unknown = [p for p in pmids if p not in known]
+    # ID変換APIへは ID_CONV_BATCH_SIZE 件ずつ問い合わせ、バッチ単位でキャッシュに記録
+    for i in range(0, len(unknown), ID_CONV_BATCH_SIZE):
+        batch = unknown[i:i + ID_CONV_BATCH_SIZE]
+        fetched = get_pmcids_from_pmids(batch)
+        # ID変換自体が失敗した場合 (None) は「PMCIDなし」として記録しない
+        if fetched is None:
+            continue
+        now = int(time.time())
+        with db:
+            db.executemany(
+                'INSERT OR REPLACE INTO m (pmid, pmcid, ts) VALUES (?, ?, ?)',
+                [(p, fetched.get(p), now) for p in batch],
+            )
+        mapping.update(fetched)
+
+    print(f"  -> PMCIDキャッシュ: {len(known)}件ヒット, {len(unknown)}件を問い合わせ")
+    return mapping
+
+
 def get_pmcids_from_pmids(pmids):
-    """PMIDリストを一括でPMCIDに変換"""
+    """
+    PMIDリスト (最大 ID_CONV_BATCH_SIZE 件) を一括でPMCIDに変換 (通信エラー時はNone)
+    URL長の上限に掛からないよう、IDはクエリ文字列ではなくPOSTの本文で送る
+    """
     if not pmids:
         return {}
     
@@ -55,7 +167,8 @@ def get_pmcids_from_pmids(pmids):
         params['api_key'] = NCBI_API_KEY
     
     try:
-        response = requests.get(ID_CONV_URL, params=params, timeout=30)
+        RATE_LIMITER.wait()
+        response = SESSION.post(ID_CONV_URL, data=params, timeout=30)
         response.raise_for_status()
         data = response.json()
         
@@ -67,7 +180,7 @@ def get_pmcids_from_pmids(pmids):
         return mapping
     except Exception as e:
         print(f"    ! ID変換エラー: {e}")
-        return {}
+        return None
 
 def fetch_full_text_xml(pmcid):
     """PMCIDからXMLを取得し、本文テキストを抽出"""
@@ -83,26 +196,34 @@ def fetch_full_text_xml(pmcid):
         params['api_key'] = NCBI_API_KEY
 
     try:
-        response = requests.get(EFETCH_URL, params=params, timeout=60)
-        response.raise_for_status()
-        
-        root = ET.fromstring(response.content)
-        
-        # 本文抽出ロジック強化
-        # bodyタグだけでなく、記事全体から有用なテキストを探す
-        full_text_parts = []
-        
-        # タイトル、アブストラクト以外の本文セクションを取得
-        body_elems = root.findall('.//body')
+        RATE_LIMITER.wait()
+        with SESSION.get(EFETCH_URL, params=params, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True  # gzip は urllib3 側で展開
+            
+            # 本文抽出ロジック強化
+            # bodyタグだけでなく、記事全体から有用なテキストを探す
+            full_text_parts = []
+            
+            # タイトル、アブストラクト以外の本文セクションを取得
+            # ストリーミング解析: body の外側の要素は読み終えた時点で破棄し、DOM全体を保持しない
+            body_depth = 0
+            for event, elem in ET.iterparse(response.raw, events=('start', 'end')):
+                if elem.tag == 'body':
+                    if event == 'start':
+                        body_depth += 1
+                        continue
+                    body_depth -= 1
+                    # itertextでタグを除去してテキスト化
+                    full_text_parts.append(''.join(elem.itertext()))
+                    if body_depth == 0:
+                        elem.clear()
+                elif event == 'end' and body_depth == 0:
+                    elem.clear()
         
-        if not body_elems:
+        if not full_text_parts:
             # bodyがない場合でも、特定のタグ構造で取得できるか試行
             return None
-        
-        for body in body_elems:
-            # itertextでタグを除去してテキスト化
-            text = ''.join(body.itertext())
-            full_text_parts.append(text)
             
         combined_text = "\n".join(full_text_parts)
         
@@ -124,8 +245,7 @@ def process_json_file(file_path):
         
     print(f"処理中: {rel_path}")
     
-    with open(file_path, 'r', encoding='utf-8') as f:
-        papers = json.load(f)
+    papers = orjson.loads(file_path.read_bytes())
     
     target_papers = [
         p for p in papers 
@@ -138,7 +258,7 @@ def process_json_file(file_path):
 
     # 1. PMID -> PMCID 変換
     pmids = [str(p['pmid']) for p in target_papers] # 文字列として抽出
-    pmid_to_pmcid = get_pmcids_from_pmids(pmids)
+    pmid_to_pmcid = get_pmcids_cached(pmids)
     
     if not pmid_to_pmcid:
         print(f"  -> {len(pmids)}件中、PMCIDが見つかりませんでした")
@@ -146,19 +266,26 @@ def process_json_file(file_path):
 
     print(f"  -> {len(pmids)}件中 {len(pmid_to_pmcid)}件のPMCIDを取得")
     
-    # 2. Full Text 取得
-    updated_count = 0
-    for paper in papers:
-        if paper.get('has_full_text'):
-            continue
-            
-        # 【重要】辞書引きするときも必ずstrにする
-        pmid = str(paper.get('pmid'))
+    # 2. Full Text 取得 (レート制限の範囲で並列ダウンロード)
+    # 【重要】辞書引きするときも必ずstrにする (pmids は target_papers と同じ順序の str)
+    downloads = []
+    for paper, pmid in zip(target_papers, pmids):
         pmcid = pmid_to_pmcid.get(pmid)
-        
         if pmcid:
-            print(f"    - Downloading {pmcid} (PMID:{pmid})...")
-            full_text = fetch_full_text_xml(pmcid)
+            downloads.append((paper, pmid, pmcid))
+        else:
+            paper['has_full_text'] = False
+
+    updated_count = 0
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(fetch_full_text_xml, pmcid): (paper, pmid, pmcid)
+            for paper, pmid, pmcid in downloads
+        }
+        for future in as_completed(futures):
+            paper, pmid, pmcid = futures[future]
+            full_text = future.result()
+            print(f"    - Downloaded {pmcid} (PMID:{pmid})")
             
             if full_text:
                 paper['full_text'] = full_text
@@ -170,14 +297,13 @@ def process_json_file(file_path):
                 # print(f"      -> 取得失敗 (本文抽出不可)")
                 paper['has_full_text'] = False
             
-            time.sleep(SLEEP_TIME)
-        else:
-            paper['has_full_text'] = False 
-            
     # 3. 保存
+    # 本文を追加できた場合のみ書き戻す (orjsonでUTF-8バイト列を直接生成し、一時ファイル経由で置換)
     if updated_count > 0:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(papers, f, indent=2, ensure_ascii=False)
+        temp_path = str(file_path) + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(orjson.dumps(papers, option=orjson.OPT_INDENT_2))
+        os.replace(temp_path, file_path)
         print(f"  -> 保存完了: {updated_count}件のFull Textを追加しました")
     else:
         print("  -> 追加できるFull Textはありませんでした (PMCIDはあるが本文取得失敗)")
@@ -192,11 +318,17 @@ def main():
         return
 
     if NCBI_API_KEY:
-        print(f"INFO: API Keyを確認しました。高速モードで実行します (Interval: {SLEEP_TIME}s)")
+        print(f"INFO: API Keyを確認しました。高速モードで実行します ({REQUESTS_PER_SECOND} req/s)")
     else:
-        print(f"INFO: API Keyが見つかりません。通常モードで実行します (Interval: {SLEEP_TIME}s)")
+        print(f"INFO: API Keyが見つかりません。通常モードで実行します ({REQUESTS_PER_SECOND} req/s)")
     
-    json_files = list(DATA_ROOT.glob('**/*/papers.json'))
+    # レイアウトは domain/subsection/papers.json の2階層固定なので、再帰globではなく直接列挙する
+    json_files = [
+        Path(subsection.path) / 'papers.json'
+        for domain in os.scandir(DATA_ROOT) if domain.is_dir()
+        for subsection in os.scandir(domain.path) if subsection.is_dir()
+        if os.path.isfile(os.path.join(subsection.path, 'papers.json'))
+    ]
     
     if not json_files:
         print("papers.jsonファイルが見つかりませんでした。")
@@ -5,8 +5,9 @@ Process all papers in a domain (or all domains) with options
 """
 
 import argparse
-import json
+import orjson
 import time
+import os
 import sys
 import shutil
 from pathlib import Path
@@ -14,6 +15,7 @@ from pathlib import Path
 # Import structure function
 sys.path.insert(0, str(Path(__file__).parent))
 from structure_paper import structure_paper, safe_write_json
+from constants import SUBSECTIONS
 
 
 def clear_papers_directory(papers_dir):
@@ -21,7 +23,10 @@ def clear_papers_directory(papers_dir):
     if not papers_dir.exists():
         return
     
-    file_count = len(list(papers_dir.glob('PMID_*.json')))
+    file_count = sum(
+        1 for entry in os.scandir(papers_dir)
+        if entry.name.startswith('PMID_') and entry.name.endswith('.json')
+    )
     if file_count == 0:
         return
     
@@ -52,13 +57,6 @@ def batch_structure_papers(domain, subsection=None, force=False, skip_existing=F
         print(f"Invalid domain: {domain}")
         return
 
-    # Subsections configuration
-    SUBSECTIONS = {
-        'pharmacologic': ['glp1_receptor_agonists', 'guidelines_and_reviews', 'novel_agents'],
-        'surgical': ['procedures_and_outcomes', 'metabolic_effects', 'complications_safety'],
-        'lifestyle': ['dietary_interventions', 'physical_activity', 'behavioral_therapy']
-    }
-
     # Determine which subsections to process
     if subsection:
         if subsection not in SUBSECTIONS[domain]:
@@ -86,8 +84,8 @@ def batch_structure_papers(domain, subsection=None, force=False, skip_existing=F
             print(f"  No papers.json found, skipping...")
             continue
         
-        with open(raw_file, 'r', encoding='utf-8') as f:
-            papers = json.load(f)
+        # Decode bytes directly with orjson (no text-mode decode, C parser)
+        papers = orjson.loads(raw_file.read_bytes())
         
         total_papers = len(papers)
         print(f"  Total papers: {total_papers}")
@@ -96,10 +94,12 @@ def batch_structure_papers(domain, subsection=None, force=False, skip_existing=F
         papers_dir = Path(f'data/obesity/{domain}/{subsection}/papers')
         papers_dir.mkdir(parents=True, exist_ok=True)
         
-        processed_pmids = set()
-        for json_file in papers_dir.glob('PMID_*.json'):
-            pmid = json_file.stem.replace('PMID_', '')
-            processed_pmids.add(pmid)
+        # os.scandir: only the file names are needed, so skip building Path objects
+        processed_pmids = {
+            entry.name[len('PMID_'):-len('.json')]
+            for entry in os.scandir(papers_dir)
+            if entry.name.startswith('PMID_') and entry.name.endswith('.json')
+        }
 
         already_processed = len(processed_pmids)
         remaining = total_papers - already_processed
@@ -129,9 +129,6 @@ def batch_structure_papers(domain, subsection=None, force=False, skip_existing=F
             print(f"  [{idx+1}/{total_papers}] Processing PMID_{pmid}")
             print(f"    Title: {paper['title'][:60]}...")
 
-            # Call structure_paper with subsection argument
-            from structure_paper import structure_paper
-
             structured_data = structure_paper(paper)
 
             if not structured_data:
@@ -13,10 +13,12 @@ def check_duplicates():
     with open('data/obesity/search_results.json', 'r') as f:
         results = json.load(f)
     
-    # 全PMIDを収集
+    # 全PMIDを収集（重複除外前の件数もこの走査で数える）
     all_pmids = defaultdict(list)
+    total_before = 0
     for domain, data in results.items():
         if data and 'pmids' in data:
+            total_before += len(data['pmids'])
             for pmid in data['pmids']:
                 all_pmids[pmid].append(domain)
     
@@ -39,11 +41,14 @@ def check_duplicates():
     print("重複除外後の統計")
     print("=" * 60)
     
+    # 各PMIDの所属領域（最初に出現した領域）を一度だけ求めておく
+    owner = {pmid: domains[0] for pmid, domains in all_pmids.items()}
+    
     unique_pmids = {}
     for domain, data in results.items():
         if data and 'pmids' in data:
             # 重複PMIDを除外（最初の領域に残す）
-            unique = [pmid for pmid in data['pmids'] if all_pmids[pmid] == [domain] or all_pmids[pmid][0] == domain]
+            unique = [pmid for pmid in data['pmids'] if owner[pmid] == domain]
             unique_pmids[domain] = unique
             print(f"{domain}: {len(data['pmids'])}件 → {len(unique)}件（重複除外）")
     
@@ -66,7 +71,7 @@ def check_duplicates():
         'domains': cleaned_results,
         'duplicates': duplicates,
         'summary': {
-            'total_before': sum(len(data['pmids']) for data in results.values() if data),
+            'total_before': total_before,
             'total_after': total_unique,
             'duplicates_removed': len(duplicates)
         }
@@ -5,15 +5,20 @@ This script will DELETE ALL structured paper data without backup.
 Use with caution!
 """
 
+import os
 import shutil
 import sys
 from pathlib import Path
 
-SUBSECTIONS = {
-    'pharmacologic': ['glp1_receptor_agonists', 'guidelines_and_reviews', 'novel_agents'],
-    'surgical': ['procedures_and_outcomes', 'metabolic_effects', 'complications_safety'],
-    'lifestyle': ['dietary_interventions', 'physical_activity', 'behavioral_therapy']
-}
+from constants import SUBSECTIONS
+
+
+def count_structured_papers(papers_dir):
+    """Count PMID_*.json files without building a Path object per entry"""
+    return sum(
+        1 for entry in os.scandir(papers_dir)
+        if entry.name.startswith('PMID_') and entry.name.endswith('.json')
+    )
 
 
 def get_all_papers_dirs():
@@ -33,10 +38,8 @@ def clear_papers_dirs(dirs_to_clear, confirm=True):
     """Clear all specified papers/ directories"""
 
     # Show summary
-    total_files = 0
-    for papers_dir in dirs_to_clear:
-        json_files = list(papers_dir.glob('PMID_*.json'))
-        total_files += len(json_files)
+    file_counts = {papers_dir: count_structured_papers(papers_dir) for papers_dir in dirs_to_clear}
+    total_files = sum(file_counts.values())
 
     print(f"\n{'='*70}")
     print(f"WARNING: DESTRUCTIVE OPERATION")
@@ -45,8 +48,7 @@ def clear_papers_dirs(dirs_to_clear, confirm=True):
     print(f"Files to delete: {total_files}")
     print(f"\nDirectories:")
     for papers_dir in dirs_to_clear:
-        file_count = len(list(papers_dir.glob('PMID_*.json')))
-        print(f"  - {papers_dir} ({file_count} files)")
+        print(f"  - {papers_dir} ({file_counts[papers_dir]} files)")
 
     # Confirmation
     response = input(f"\nType 'DELETE ALL' to confirm deletion: ")
@@ -0,0 +1,12 @@
+#!/usr/bin/env python3
+"""
+Shared constants for the obesity paper data pipeline
+Layout: data/obesity/{domain}/{subsection}/papers.json
+"""
+
+# Subsections per domain (tuples: read-only and shared by every script)
+SUBSECTIONS = {
+    'pharmacologic': ('glp1_receptor_agonists', 'guidelines_and_reviews', 'novel_agents'),
+    'surgical': ('procedures_and_outcomes', 'metabolic_effects', 'complications_safety'),
+    'lifestyle': ('dietary_interventions', 'physical_activity', 'behavioral_therapy'),
+}
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Keep the HF Dedicated Endpoints (SapBERT / MedGemma) warm
+HF endpoints scale to zero after ~5 min idle, so the first query after a quiet
+period pays a multi-minute cold start. This pings them once at startup and,
+if WARMUP_INTERVAL > 0, periodically afterwards.
+- Started once per instance from the gunicorn master (when_ready hook in
+  gunicorn.conf.py), not per worker
+- Each ping is billed endpoint uptime: a periodic interval keeps the endpoints
+  from ever scaling to zero, so it is opt-in (default: startup ping only)
+- OpenRouter is not pinged (no scale-to-zero)
+"""
+
+import os
+import threading
+import time
+
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Seconds between pings (0 = ping once at startup only); ~240 keeps HF endpoints from idling out
+WARMUP_INTERVAL = int(os.getenv('WARMUP_INTERVAL', '0'))
+_warmup_lock = threading.Lock()
+_warmup_started = False
+
+
+def warm_endpoints():
+    """
+    Send tiny requests to the HF Dedicated Endpoints so they stay (or become) hot.
+    Posts directly instead of via encode_via_hf_dedicated(), whose embedding cache
+    would short-circuit repeated pings.
+    """
+    hf_token = os.getenv('HF_TOKEN', '')
+    headers = {"Authorization": f"Bearer {hf_token}", "Content-Type": "application/json"}
+
+    sapbert_endpoint = os.getenv('SAPBERT_ENDPOINT')
+    if sapbert_endpoint and hf_token:
+        try:
+            requests.post(sapbert_endpoint, headers=headers, json={"inputs": "warm"}, timeout=30)
+        except Exception as exc:
+            print(f"[warmup] SapBERT ping failed: {exc}")
+
+    medgemma_endpoint = os.getenv('MEDGEMMA_CLOUD_ENDPOINT', '').rstrip('/')
+    if medgemma_endpoint and hf_token:
+        try:
+            requests.post(
+                f"{medgemma_endpoint}/v1/chat/completions",
+                headers=headers,
+                json={"model": "tgi", "messages": [{"role": "user", "content": "warm"}], "max_tokens": 5},
+                timeout=60
+            )
+        except Exception as exc:
+            print(f"[warmup] MedGemma ping failed: {exc}")
+
+
+def _warmup_loop():
+    while True:
+        warm_endpoints()
+        if WARMUP_INTERVAL <= 0:
+            return
+        time.sleep(WARMUP_INTERVAL)
+
+
+def start_endpoint_warmup():
+    """Start the background warm-up thread once per process (HF Endpoint mode only)."""
+    global _warmup_started
+    if not os.getenv('MEDGEMMA_CLOUD_ENDPOINT'):
+        return
+    with _warmup_lock:
+        if _warmup_started:
+            return
+        _warmup_started = True
+    threading.Thread(target=_warmup_loop, name='endpoint-warmup', daemon=True).start()
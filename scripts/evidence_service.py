@@ -6,7 +6,83 @@
 import re
 from typing import Dict, List
 from pubmed_client import PubMedClient
-from medical_terms_dict import get_medical_term
+from medical_terms_dict import get_all_terms
+
+# 基本的なカタカナ→ローマ字マッピング（全て1文字キーなので str.translate の変換表にできる）
+KATAKANA_MAP = {
+    'ア': 'a', 'イ': 'i', 'ウ': 'u', 'エ': 'e', 'オ': 'o',
+    'カ': 'ka', 'キ': 'ki', 'ク': 'ku', 'ケ': 'ke', 'コ': 'ko',
+    'サ': 'sa', 'シ': 'shi', 'ス': 'su', 'セ': 'se', 'ソ': 'so',
+    'タ': 'ta', 'チ': 'chi', 'ツ': 'tsu', 'テ': 'te', 'ト': 'to',
+    'ナ': 'na', 'ニ': 'ni', 'ヌ': 'nu', 'ネ': 'ne', 'ノ': 'no',
+    'ハ': 'ha', 'ヒ': 'hi', 'フ': 'fu', 'ヘ': 'he', 'ホ': 'ho',
+    'マ': 'ma', 'ミ': 'mi', 'ム': 'mu', 'メ': 'me', 'モ': 'mo',
+    'ヤ': 'ya', 'ユ': 'yu', 'ヨ': 'yo',
+    'ラ': 'ra', 'リ': 'ri', 'ル': 'ru', 'レ': 're', 'ロ': 'ro',
+    'ワ': 'wa', 'ヲ': 'wo', 'ン': 'n',
+    'ガ': 'ga', 'ギ': 'gi', 'グ': 'gu', 'ゲ': 'ge', 'ゴ': 'go',
+    'ザ': 'za', 'ジ': 'ji', 'ズ': 'zu', 'ゼ': 'ze', 'ゾ': 'zo',
+    'ダ': 'da', 'ヂ': 'ji', 'ヅ': 'zu', 'デ': 'de', 'ド': 'do',
+    'バ': 'ba', 'ビ': 'bi', 'ブ': 'bu', 'ベ': 'be', 'ボ': 'bo',
+    'パ': 'pa', 'ピ': 'pi', 'プ': 'pu', 'ペ': 'pe', 'ポ': 'po',
+    'ャ': 'ya', 'ュ': 'yu', 'ョ': 'yo',
+    'ー': '', 'ッ': '',  # 長音符と促音は削除
+}
+_KATAKANA_TABLE = str.maketrans(KATAKANA_MAP)
+
+# _reformulate_query で使う正規表現（呼び出しごとにパターンを引き直さない）
+_JAPANESE_RE = re.compile(r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]')
+_KATAKANA_RUN_RE = re.compile(r'[\u30A0-\u30FF]+')
+# 句読点とストップワードを1回の走査でまとめて削除（句読点は語の区切りとして空白に置換）
+_CLEAN_RE = re.compile(
+    r'[?？。、,，]|\b(?:is|are|the|a|an|in|on|at|to|for|of|with)\b', re.IGNORECASE
+)
+_WH_RE = re.compile(r'^\s*(what|how|when|where|why|who|which)\s+', re.IGNORECASE)
+_WS_RE = re.compile(r'\s+')
+
+_TERM_KEY = object()  # 1文字キーと衝突しない終端マーカー
+
+
+def _build_term_trie(terms: Dict[str, str]) -> Dict:
+    """
+    医学用語辞書から文字単位のトライ木を構築（終端ノードの _TERM_KEY に英語の用語を保持）
+
+    Args:
+        terms: 日本語→英語の医学用語辞書
+
+    Returns:
+        ネストした辞書によるトライ木
+    """
+    root = {}
+    for japanese, english in terms.items():
+        node = root
+        for char in japanese:
+            node = node.setdefault(char, {})
+        node[_TERM_KEY] = english
+    return root
+
+
+_TERM_TRIE = _build_term_trie(get_all_terms())
+
+
+def _longest_medical_term(text: str, position: int):
+    """
+    text[position:] の先頭に一致する最長の医学用語を返す
+
+    トライ木を1回たどるだけなので、長さごとに辞書を引き直す必要がない
+
+    Returns:
+        (一致した長さ, 英語の用語)、一致しない場合は None
+    """
+    node = _TERM_TRIE
+    match = None
+    for end in range(position, len(text)):
+        node = node.get(text[end])
+        if node is None:
+            break
+        if _TERM_KEY in node:
+            match = (end - position + 1, node[_TERM_KEY])
+    return match
 
 
 class EvidenceService:
@@ -112,7 +188,7 @@ class EvidenceService:
             PubMed検索用のクエリ文字列
         """
         # ステップ1: 言語検出（簡易版）
-        is_japanese = bool(re.search(r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]', question))
+        is_japanese = bool(_JAPANESE_RE.search(question))
 
         if is_japanese:
             # ステップ2: 日本語医学用語を英語に変換
@@ -124,40 +200,31 @@ class EvidenceService:
             position = 0
 
             while position < len(remaining_text):
-                # 現在位置から最長の医学用語を探す
+                # 現在位置から最長の医学用語を探す（トライ木で1パス）
                 matched = False
-                max_length = min(20, len(remaining_text) - position)  # 最大20文字まで
-
-                # 長い語から順に試す
-                for length in range(max_length, 0, -1):
-                    substring = remaining_text[position:position + length]
-
-                    # 医学用語辞書で検索
-                    english_term = get_medical_term(substring)
-
-                    if english_term:
-                        # OR演算子を含む用語はそのまま追加せず、最初の単語のみ使用
-                        if ' OR ' in english_term:
-                            first_term = english_term.split(' OR ')[0]
-                            query_parts.append(first_term)
-                        else:
-                            query_parts.append(english_term)
+                term = _longest_medical_term(remaining_text, position)
+
+                if term:
+                    length, english_term = term
+                    # OR演算子を含む用語はそのまま追加せず、最初の単語のみ使用
+                    if ' OR ' in english_term:
+                        first_term = english_term.split(' OR ')[0]
+                        query_parts.append(first_term)
+                    else:
+                        query_parts.append(english_term)
 
-                        position += length
-                        matched = True
-                        break
+                    position += length
+                    matched = True
 
                 if not matched:
                     # マッチしない場合、1文字進める
-                    char = remaining_text[position]
 
                     # カタカナの場合は単語として抽出
-                    if re.match(r'[\u30A0-\u30FF]', char):
+                    katakana_run = _KATAKANA_RUN_RE.match(remaining_text, position)
+                    if katakana_run:
                         # カタカナの連続を取得
-                        katakana_word = ''
-                        while position < len(remaining_text) and re.match(r'[\u30A0-\u30FF]', remaining_text[position]):
-                            katakana_word += remaining_text[position]
-                            position += 1
+                        katakana_word = katakana_run.group()
+                        position = katakana_run.end()
 
                         # ローマ字化
                         romanized = self._romanize_katakana(katakana_word)
@@ -188,12 +255,11 @@ class EvidenceService:
             query = question
 
         # ステップ3: 不要な語句を削除
-        query = re.sub(r'[?？。、,，]', '', query)
-        query = re.sub(r'^(what|how|when|where|why|who|which)\s+', '', query, flags=re.IGNORECASE)
-        query = re.sub(r'\b(is|are|the|a|an|in|on|at|to|for|of|with)\b', '', query, flags=re.IGNORECASE)
+        query = _CLEAN_RE.sub(' ', query)
+        query = _WH_RE.sub('', query)
 
         # ステップ4: 複数スペースを1つに
-        query = re.sub(r'\s+', ' ', query).strip()
+        query = _WS_RE.sub(' ', query).strip()
 
         return query
 
@@ -210,32 +276,8 @@ class EvidenceService:
         Returns:
             ローマ字化された文字列
         """
-        # 基本的なカタカナ→ローマ字マッピング
-        katakana_map = {
-            'ア': 'a', 'イ': 'i', 'ウ': 'u', 'エ': 'e', 'オ': 'o',
-            'カ': 'ka', 'キ': 'ki', 'ク': 'ku', 'ケ': 'ke', 'コ': 'ko',
-            'サ': 'sa', 'シ': 'shi', 'ス': 'su', 'セ': 'se', 'ソ': 'so',
-            'タ': 'ta', 'チ': 'chi', 'ツ': 'tsu', 'テ': 'te', 'ト': 'to',
-            'ナ': 'na', 'ニ': 'ni', 'ヌ': 'nu', 'ネ': 'ne', 'ノ': 'no',
-            'ハ': 'ha', 'ヒ': 'hi', 'フ': 'fu', 'ヘ': 'he', 'ホ': 'ho',
-            'マ': 'ma', 'ミ': 'mi', 'ム': 'mu', 'メ': 'me', 'モ': 'mo',
-            'ヤ': 'ya', 'ユ': 'yu', 'ヨ': 'yo',
-            'ラ': 'ra', 'リ': 'ri', 'ル': 'ru', 'レ': 're', 'ロ': 'ro',
-            'ワ': 'wa', 'ヲ': 'wo', 'ン': 'n',
-            'ガ': 'ga', 'ギ': 'gi', 'グ': 'gu', 'ゲ': 'ge', 'ゴ': 'go',
-            'ザ': 'za', 'ジ': 'ji', 'ズ': 'zu', 'ゼ': 'ze', 'ゾ': 'zo',
-            'ダ': 'da', 'ヂ': 'ji', 'ヅ': 'zu', 'デ': 'de', 'ド': 'do',
-            'バ': 'ba', 'ビ': 'bi', 'ブ': 'bu', 'ベ': 'be', 'ボ': 'bo',
-            'パ': 'pa', 'ピ': 'pi', 'プ': 'pu', 'ペ': 'pe', 'ポ': 'po',
-            'ャ': 'ya', 'ュ': 'yu', 'ョ': 'yo',
-            'ー': '', 'ッ': '',  # 長音符と促音は削除
-        }
-
-        result = ''
-        for char in katakana:
-            result += katakana_map.get(char, char.lower())
-
-        return result
+        # 変換表で一括置換（ローマ字は全て小文字なので、lower()は未登録文字にのみ作用する）
+        return katakana.translate(_KATAKANA_TABLE).lower()
 
     def _format_evidence_context(self, papers: List[Dict]) -> str:
         """
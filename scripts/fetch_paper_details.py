@@ -25,10 +25,15 @@ PubMed検索を行い、LLMで有用性を判定して階層ディレクトリ
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import orjson
 import time
 import os
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from xml.etree import ElementTree as ET
 from openai import OpenAI
@@ -44,6 +49,25 @@ OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 # PubMed API URL
 ESEARCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
 EFETCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+NCBI_API_KEY = os.getenv("NCBI_API_KEY")
+
+# NCBIの上限: APIキーあり 10 req/s, なし 3 req/s (サブセクションは並列に処理し、送信間隔だけを共有する)
+REQUEST_INTERVAL = 0.1 if NCBI_API_KEY else 0.34
+MAX_WORKERS = 9
+
+# 全リクエスト共通のパラメータ (api_key を含む) は一度だけ組み立てる
+NCBI_BASE_PARAMS = {'db': 'pubmed'}
+if NCBI_API_KEY:
+    NCBI_BASE_PARAMS['api_key'] = NCBI_API_KEY
+
+# NCBIへの接続を使い回す (TLSハンドシェイクを毎回行わない) + 一時的なエラーは再試行
+SESSION = requests.Session()
+SESSION.headers.update({'User-Agent': 'clinical-evidence-agent/1.0'})
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504]),
+))
 
 # 分野とサブセクション、検索クエリの定義
 # 期間は過去5-10年、主要な論文タイプに絞る設定を含めています
@@ -65,60 +89,110 @@ SEARCH_CONFIG = {
     }
 }
 
+# サブセクションの選別リクエストは並列に送る (同時実行数は LLM_MAX_CONCURRENCY まで)
+# 429 / 5xx は OpenAI クライアント側で指数バックオフ付きで再試行される
+LLM_MAX_CONCURRENCY = 5
+LLM_MAX_RETRIES = 5
+
 client = OpenAI(
     base_url="https://openrouter.ai/api/v1",
     api_key=OPENROUTER_API_KEY,
+    max_retries=LLM_MAX_RETRIES,
 )
+_llm_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
+# 選別プロンプトに含める抄録の上限 (UTF-8バイト数)
+# 文字数ではなくバイト数で切ることで、英語は従来通り約800文字、日本語・中国語などは約1/3の文字数になり
+# トークン数に近い基準で入力を抑えられる
+LLM_ABSTRACT_MAX_BYTES = 800
 
 # ==========================================
 # 関数定義
 # ==========================================
 
+_rate_lock = threading.Lock()
+_last_request_time = 0.0
+
+
+def rate_limit():
+    """NCBIへのリクエスト間隔を制限（スレッドセーフ: 送信枠をロック内で予約し、待機はロック外で行う）"""
+    global _last_request_time
+    with _rate_lock:
+        slot = max(time.time(), _last_request_time + REQUEST_INTERVAL)
+        _last_request_time = slot
+    delay = slot - time.time()
+    if delay > 0:
+        time.sleep(delay)
+
+
 def search_pubmed(query, max_results=20):
     """
     指定されたクエリでPubMedを検索し、PMIDリストを返す
+    検索結果はNCBIのHistoryサーバーにも保存し (usehistory=y)、EFetchから参照できるようにする
+
+    Returns:
+        (PMIDリスト, {'WebEnv': ..., 'query_key': ...} または None)
     """
     params = {
-        'db': 'pubmed',
+        **NCBI_BASE_PARAMS,
         'term': query,
         'retmax': max_results,
         'retmode': 'json',
-        'sort': 'relevance' # 関連度順
+        'sort': 'relevance', # 関連度順
+        'usehistory': 'y'
     }
     try:
-        response = requests.get(ESEARCH_URL, params=params, timeout=30)
+        rate_limit()
+        response = SESSION.get(ESEARCH_URL, params=params, timeout=30)
         response.raise_for_status()
-        data = response.json()
-        return data.get('esearchresult', {}).get('idlist', [])
+        result = response.json().get('esearchresult', {})
+        history = None
+        if result.get('webenv') and result.get('querykey'):
+            history = {'WebEnv': result['webenv'], 'query_key': result['querykey']}
+        return result.get('idlist', []), history
     except Exception as e:
         print(f"    ! 検索エラー: {e}")
-        return []
+        return [], None
 
-def fetch_papers_details(pmids):
+def fetch_papers_details(pmids, history=None):
     """
     PMIDリストから論文詳細を取得 (EFetch)
+
+    history (search_pubmed の戻り値) を渡した場合、pmids は検索結果の先頭N件であること。
+    PMIDを連結して送る代わりに WebEnv/query_key + retmax で結果セットを参照する
     """
     if not pmids:
         return []
     
-    # URL長対策のため、batchはここではなく呼び出し元で制御推奨だが、
-    # 今回は max_results=20程度なので一括で処理
     papers = []
-    params = {
-        'db': 'pubmed',
-        'id': ','.join(pmids),
-        'retmode': 'xml'
-    }
+    if history:
+        params = {
+            **NCBI_BASE_PARAMS,
+            **history,
+            'retstart': 0,
+            'retmax': len(pmids),
+            'retmode': 'xml'
+        }
+    else:
+        params = {
+            **NCBI_BASE_PARAMS,
+            'id': ','.join(pmids),
+            'retmode': 'xml'
+        }
     
     try:
-        response = requests.get(EFETCH_URL, params=params, timeout=60)
-        response.raise_for_status()
-        root = ET.fromstring(response.content)
-        
-        for article in root.findall('.//PubmedArticle'):
-            paper = parse_article_xml(article)
-            if paper:
-                papers.append(paper)
+        rate_limit()
+        with SESSION.get(EFETCH_URL, params=params, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True  # gzip は urllib3 側で展開
+
+            # ストリーミング解析: PubmedArticle を1件読み終えるごとに変換して破棄し、DOM全体を保持しない
+            for event, elem in ET.iterparse(response.raw, events=('end',)):
+                if elem.tag == 'PubmedArticle':
+                    paper = parse_article_xml(elem)
+                    if paper:
+                        papers.append(paper)
+                    elem.clear()
         return papers
     except Exception as e:
         print(f"    ! 詳細取得エラー: {e}")
@@ -126,25 +200,46 @@ def fetch_papers_details(pmids):
 
 def parse_article_xml(article_elem):
     """
-    XMLパース処理
+    XMLパース処理 (記事のサブツリーを1回だけ走査し、必要なタグを拾う)
     """
     try:
-        pmid = article_elem.find('.//PMID').text
-        title = article_elem.find('.//ArticleTitle').text or "No Title"
+        pmid_elem = title_elem = journal_elem = pub_date_elem = None
+        abstract_texts = []
+        for elem in article_elem.iter():
+            tag = elem.tag
+            if tag == 'PMID':
+                if pmid_elem is None:
+                    pmid_elem = elem
+            elif tag == 'ArticleTitle':
+                if title_elem is None:
+                    title_elem = elem
+            elif tag == 'Abstract':
+                # OtherAbstract (翻訳抄録) 内の AbstractText は含めない
+                abstract_texts.extend(t for t in elem if t.tag == 'AbstractText')
+            elif tag == 'Journal':
+                if journal_elem is None:
+                    journal_elem = elem
+            elif tag == 'PubDate':
+                if pub_date_elem is None:
+                    pub_date_elem = elem
+
+        pmid = pmid_elem.text
+        # <i>, <sup> などのインライン要素を含むと .text は先頭部分しか返さないため itertext() で連結する
+        title = ''.join(title_elem.itertext()) or "No Title"
         
-        abstract_texts = article_elem.findall('.//Abstract/AbstractText')
         if abstract_texts:
             parts = []
             for t in abstract_texts:
-                if t.text:
+                text = ''.join(t.itertext())
+                if text:
                     label = t.attrib.get('Label', '')
-                    parts.append(f"{label}: {t.text}" if label else t.text)
+                    parts.append(f"{label}: {text}" if label else text)
             abstract = '\n\n'.join(parts)
         else:
             abstract = "No Abstract"
         
-        journal = article_elem.find('.//Journal/Title').text or ""
-        year_elem = article_elem.find('.//PubDate/Year')
+        journal = journal_elem.find('Title').text or ""
+        year_elem = pub_date_elem.find('Year') if pub_date_elem is not None else None
         year = year_elem.text if year_elem is not None else "N/A"
         
         return {
@@ -163,10 +258,13 @@ def load_existing_papers(save_dir):
     """
     save_path = Path(save_dir) / 'papers.json'
     if save_path.exists():
-        with open(save_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return orjson.loads(save_path.read_bytes())
     return []
 
+def truncate_utf8(text, max_bytes):
+    """UTF-8でmax_bytesバイト以内に切り詰める (途中で切れたマルチバイト文字は捨てる)"""
+    return text.encode('utf-8')[:max_bytes].decode('utf-8', 'ignore')
+
 def filter_papers_with_llm(papers, category, subsection):
     """
     LLMを使用して、論文が該当サブセクションの学習資料として適切か判定
@@ -176,7 +274,7 @@ def filter_papers_with_llm(papers, category, subsection):
 
     print(f"    > LLM選別開始: {category}/{subsection} ({len(papers)}件)")
 
-    candidates = [{"id": p['pmid'], "title": p['title'], "abstract": p['abstract'][:800]} for p in papers]
+    candidates = [{"id": p['pmid'], "title": p['title'], "abstract": truncate_utf8(p['abstract'], LLM_ABSTRACT_MAX_BYTES)} for p in papers]
 
     system_prompt = f"""
     あなたは医学リサーチアシスタントです。
@@ -197,15 +295,16 @@ def filter_papers_with_llm(papers, category, subsection):
     """
 
     try:
-        completion = client.chat.completions.create(
-            model=LLM_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": json.dumps(candidates, ensure_ascii=False)}
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.0
-        )
+        with _llm_slots:
+            completion = client.chat.completions.create(
+                model=LLM_MODEL,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": json.dumps(candidates, ensure_ascii=False)}
+                ],
+                response_format={"type": "json_object"},
+                temperature=0.0
+            )
 
         content = completion.choices[0].message.content
         if content is None:
@@ -222,6 +321,52 @@ def filter_papers_with_llm(papers, category, subsection):
         print(f"    ! LLMエラー: {e}")
         return papers # エラー時は全件保存（安全策）
 
+def process_subsection(category, subsection, query, max_results):
+    """
+    1サブセクション分の検索・選別・保存を行う（ワーカースレッドで実行）
+
+    Returns:
+        (保存後の論文数, 表示用ログ行のリスト)
+    """
+    log = []
+
+    # 1. 保存先ディレクトリ作成
+    save_dir = Path(f'data/obesity/{category}/{subsection}')
+    save_dir.mkdir(parents=True, exist_ok=True)
+
+    # 2. 既存データの読み込み
+    existing_papers = load_existing_papers(save_dir)
+    existing_pmids = {p['pmid'] for p in existing_papers}
+
+    # 3. 検索 (ESearch) - 既存分を含めて取得して重複を除外
+    search_limit = max_results + len(existing_pmids)
+    all_pmids, history = search_pubmed(query, max_results=search_limit)
+
+    new_pmids = [pmid for pmid in all_pmids if pmid not in existing_pmids][:max_results]
+
+    if not new_pmids:
+        log.append(f"    -> 新規論文なし (既存{len(existing_papers)}件のみ)")
+        return len(existing_papers), log
+
+    # 4. 詳細取得 (EFetch) - 新規PMIDのみ
+    # 新規PMIDが検索結果の先頭N件そのもの (初回取得など) なら Historyサーバーの結果セットを参照する
+    if new_pmids != all_pmids[:len(new_pmids)]:
+        history = None
+    papers = fetch_papers_details(new_pmids, history)
+
+    # 5. LLMフィルタリング（新規取得データのみ）
+    valid_papers = filter_papers_with_llm(papers, category, subsection)
+
+    # 6. マージして保存
+    merged_papers = existing_papers + valid_papers
+    save_path = save_dir / 'papers.json'
+
+    # orjsonはUTF-8バイト列を直接生成する (ensure_ascii=False 相当)
+    save_path.write_bytes(orjson.dumps(merged_papers, option=orjson.OPT_INDENT_2))
+
+    log.append(f"    -> 保存完了: 既存 {len(existing_papers)} + 新規 {len(valid_papers)} = 総計 {len(merged_papers)}件 ({save_path})")
+    return len(merged_papers), log
+
 # ==========================================
 # メイン処理
 # ==========================================
@@ -248,52 +393,29 @@ def main():
     print(f"ダウンロード件数: {args.max_results}件/サブセクション")
     print("=" * 60)
 
-    total_saved = 0
-
-    for category in target_categories:
-        subsections = SEARCH_CONFIG[category]
-        print(f"\n■ 分野: {category.upper()}")
-        
-        for subsection, query in subsections.items():
+    # 全サブセクションを並列に処理し (PubMed / LLM の待ち時間を重ねる)、ログは定義順に表示
+    tasks = [
+        (category, subsection, query)
+        for category in target_categories
+        for subsection, query in SEARCH_CONFIG[category].items()
+    ]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [
+            executor.submit(process_subsection, category, subsection, query, args.max_results)
+            for category, subsection, query in tasks
+        ]
+
+        total_saved = 0
+        current_category = None
+        for (category, subsection, _), future in zip(tasks, futures):
+            if category != current_category:
+                current_category = category
+                print(f"\n■ 分野: {category.upper()}")
             print(f"  ├ サブセクション: {subsection}")
-
-            # 1. 保存先ディレクトリ作成
-            save_dir = Path(f'data/obesity/{category}/{subsection}')
-            save_dir.mkdir(parents=True, exist_ok=True)
-
-            # 2. 既存データの読み込み
-            existing_papers = load_existing_papers(save_dir)
-            existing_pmids = {p['pmid'] for p in existing_papers}
-
-            # 3. 検索 (ESearch) - 既存分を含めて取得して重複を除外
-            search_limit = args.max_results + len(existing_pmids)
-            all_pmids = search_pubmed(query, max_results=search_limit)
-
-            new_pmids = [pmid for pmid in all_pmids if pmid not in existing_pmids][:args.max_results]
-
-            if not new_pmids:
-                print(f"    -> 新規論文なし (既存{len(existing_papers)}件のみ)")
-                total_saved += len(existing_papers)
-                continue
-            
-            # 4. 詳細取得 (EFetch) - 新規PMIDのみ
-            papers = fetch_papers_details(new_pmids)
-
-            # 5. LLMフィルタリング（新規取得データのみ）
-            valid_papers = filter_papers_with_llm(papers, category, subsection)
-
-            # 6. マージして保存
-            merged_papers = existing_papers + valid_papers
-            save_path = save_dir / 'papers.json'
-
-            with open(save_path, 'w', encoding='utf-8') as f:
-                json.dump(merged_papers, f, indent=2, ensure_ascii=False)
-
-            print(f"    -> 保存完了: 既存 {len(existing_papers)} + 新規 {len(valid_papers)} = 総計 {len(merged_papers)}件 ({save_path})")
-            total_saved += len(merged_papers)
-            
-            # API負荷軽減のための待機
-            time.sleep(1)
+            saved, log_lines = future.result()
+            for line in log_lines:
+                print(line)
+            total_saved += saved
 
     print(f"\n{'=' * 60}")
     print(f"全処理完了。合計 {total_saved} 件の論文をダウンロードしました。")
@@ -10,18 +10,29 @@ Merged version with:
 """
 
 from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct, Distance, VectorParams
+from qdrant_client.models import (
+    Batch, Distance, VectorParams,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType
+)
 from sentence_transformers import SentenceTransformer
+import torch
 from pathlib import Path
-import json
+import orjson
 import numpy as np
 import time
 import uuid
+import hashlib
+import sqlite3
 import logging
-import subprocess
+import stat
+import atexit
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from dotenv import load_dotenv
+from constants import SUBSECTIONS
+from qdrant_server import QDRANT_PREFER_GRPC, connect_qdrant_server
 
 # Load environment variables from .env file
 load_dotenv()
@@ -30,22 +41,28 @@ load_dotenv()
 logging.getLogger('sentence_transformers').setLevel(logging.ERROR)
 
 def get_cache_size(model_path):
-    """Get cache size in MB for a given HuggingFace model path"""
+    """Get the human-readable cache size (like `du -sh`) of a HuggingFace model path
+    
+    Walks the tree with os.walk instead of forking `du`. Symlinks are not followed:
+    snapshots/ links into blobs/, so following them would count every file twice.
+    """
     try:
-        result = subprocess.run(
-            ['du', '-sh', model_path],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        if result.returncode == 0:
-            return result.stdout.split()[0]
-    except:
-        pass
-    return "Unknown"
+        total = 0
+        for root, _, files in os.walk(model_path):
+            for name in files:
+                st = os.lstat(os.path.join(root, name))
+                if not stat.S_ISLNK(st.st_mode):
+                    total += st.st_size
+        for unit in ('B', 'K', 'M', 'G'):
+            if total < 1024:
+                return f"{total:.1f}{unit}"
+            total /= 1024
+        return f"{total:.1f}T"
+    except OSError:
+        return "Unknown"
 
 def initialize_qdrant_client(use_cloud=False):
-    """Initialize Qdrant client - local or cloud"""
+    """Initialize Qdrant client - cloud, QDRANT_URL server (the store the app reads) or local"""
     if use_cloud:
         # Get cloud credentials from environment
         cloud_url = os.getenv('QDRANT_CLOUD_ENDPOINT')
@@ -60,15 +77,27 @@ def initialize_qdrant_client(use_cloud=False):
         
         print("Connecting to Qdrant Cloud...")
         print(f"  Endpoint: {cloud_url}")
-        client = QdrantClient(url=cloud_url, api_key=cloud_api_key)
+        # gRPC (QDRANT_PREFER_GRPC) sends vectors as protobuf instead of JSON float lists
+        client = QdrantClient(url=cloud_url, api_key=cloud_api_key, prefer_grpc=QDRANT_PREFER_GRPC)
         print("✓ Connected to Qdrant Cloud")
         return client, "cloud"
-    else:
-        # Local mode
-        print("Initializing local Qdrant client...")
-        client = QdrantClient(path="./qdrant_medical_db")
-        print("✓ Local Qdrant client initialized")
-        return client, "local"
+    
+    server_client = connect_qdrant_server()
+    if server_client is not None:
+        return server_client, "server"
+    
+    # Local mode
+    print("Initializing local Qdrant client...")
+    client = QdrantClient(path="./qdrant_medical_db")
+    print("✓ Local Qdrant client initialized")
+    return client, "local"
+
+
+# int8 scalar quantization: quantized vectors stay in RAM for scoring, originals live on disk
+# (4x smaller index; Qdrant rescoring keeps cosine quality on normalized BERT embeddings)
+QUANTIZATION_CONFIG = ScalarQuantization(
+    scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+)
 
 
 def setup_collections(client):
@@ -84,10 +113,11 @@ def setup_collections(client):
         client.create_collection(
             collection_name="medical_papers",
             vectors_config={
-                "sapbert_pico": VectorParams(size=768, distance=Distance.COSINE),
-                "e5_pico": VectorParams(size=1024, distance=Distance.COSINE),
-                "e5_questions_en": VectorParams(size=1024, distance=Distance.COSINE)
-            }
+                "sapbert_pico": VectorParams(size=768, distance=Distance.COSINE, on_disk=True),
+                "e5_pico": VectorParams(size=1024, distance=Distance.COSINE, on_disk=True),
+                "e5_questions_en": VectorParams(size=1024, distance=Distance.COSINE, on_disk=True)
+            },
+            quantization_config=QUANTIZATION_CONFIG
         )
         print("  ✓ Created collection: medical_papers")
     
@@ -100,176 +130,563 @@ def setup_collections(client):
         client.create_collection(
             collection_name="atomic_facts",
             vectors_config={
-                "sapbert_fact": VectorParams(size=768, distance=Distance.COSINE)
-            }
+                "sapbert_fact": VectorParams(size=768, distance=Distance.COSINE, on_disk=True)
+            },
+            quantization_config=QUANTIZATION_CONFIG
         )
         print("  ✓ Created collection: atomic_facts")
 
-# Load models (use default HuggingFace cache)
-print("\nLoading embedding models...")
-print("(Models are cached in ~/.cache/huggingface)")
-
-# Load SapBERT
-sapbert_cache = Path.home() / '.cache/huggingface/hub/models--cambridgeltl--SapBERT-from-PubMedBERT-fulltext'
-if sapbert_cache.exists():
-    size = get_cache_size(sapbert_cache)
-    print(f"Loading SapBERT from cache ({size})...")
-else:
-    print("Loading SapBERT (first run - will download ~420MB)...")
-
-try:
-    sapbert = SentenceTransformer(
-        'cambridgeltl/SapBERT-from-PubMedBERT-fulltext'
+# Pin PyTorch CPU threads (default can over/undersubscribe shared hosts)
+torch.set_num_threads(int(os.getenv('TORCH_THREADS', os.cpu_count() or 1)))
+torch.set_num_interop_threads(1)
+
+
+def resolve_device():
+    """Pick the encode device: EMBED_DEVICE (cuda / mps / cpu) or auto-detect"""
+    device = os.getenv('EMBED_DEVICE', 'auto').lower()
+    if device != 'auto':
+        return device
+    if torch.cuda.is_available():
+        return 'cuda'
+    if torch.backends.mps.is_available():
+        return 'mps'
+    return 'cpu'
+
+
+DEVICE = resolve_device()
+
+# torch.compile the transformer backbones (PyTorch 2.x). Opt-in: compilation costs a
+# warm-up of tens of seconds, which only pays off on long runs
+EMBED_COMPILE = os.getenv('EMBED_COMPILE', '0').lower() in ('1', 'true', 'yes')
+
+# CPU worker processes per model (torch backend on CPU only). >1 shards each encode() across
+# a sentence-transformers multi-process pool; every worker gets CPU count / N threads
+EMBED_PROCESSES = int(os.getenv('EMBED_PROCESSES', '1'))
+
+# Inference backend: torch (default), onnx (ONNX Runtime on CPU with an O3-optimized graph:
+# fused attention / LayerNorm / GELU, constant folding) or onnx-int8 (the same graph with
+# dynamic int8 MatMuls, VNNI-accelerated on AVX512 CPUs). Exports are cached under
+# .cache/onnx/ so only the first run pays for them. Requires sentence-transformers[onnx]
+EMBED_BACKEND = os.getenv('EMBED_BACKEND', 'torch').lower()
+ONNX_CACHE_DIR = Path(__file__).resolve().parent.parent / '.cache' / 'onnx'
+
+# Token cap per input (default: the model's own limit, 512). PICO fragments, atomic facts and
+# questions are short; a lower cap bounds the padded length (attention is quadratic in it)
+# when a batch contains an unusually long text, at the cost of truncating that text
+EMBED_MAX_SEQ_LENGTH = int(os.getenv('EMBED_MAX_SEQ_LENGTH', '0'))
+
+# int8 / truncated vectors differ from full float ones: keep them apart in the embedding cache.
+# id(model) -> cache key suffix of the backend that actually loaded, filled by create_model()
+# (onnx-int8 falls back to the float model when validation fails)
+_cache_suffixes = {}
+
+# Minimum mean cosine between int8 and float embeddings of the validation texts;
+# below it the float ONNX model is used instead
+INT8_MIN_COSINE = 0.99
+INT8_VALIDATION_TEXTS = [
+    "P: Adults with obesity (BMI >= 30). I: Semaglutide 2.4 mg once weekly. C: Placebo. O: Percent change in body weight at 68 weeks.",
+    "P: Patients with severe obesity and type 2 diabetes. I: Roux-en-Y gastric bypass. C: Sleeve gastrectomy. O: Diabetes remission at 5 years.",
+    "Intermittent fasting produced weight loss similar to continuous caloric restriction over 12 months.",
+    "query: Does tirzepatide cause more gastrointestinal adverse events than semaglutide?",
+    "passage: Cognitive behavioral therapy improved weight maintenance after a lifestyle intervention.",
+]
+
+# Embedding models: loaded by load_models() only when papers are actually encoded,
+# so --check / --help and runs with nothing to do skip ~3GB of model loading
+sapbert = None
+multilingual_e5 = None
+
+
+def load_onnx_model(model_name, quantized=False):
+    """Load model_name on ONNX Runtime, exporting + optimizing (and int8-quantizing) it on first use
+
+    Returns:
+        (model, is_int8) -- is_int8 is False when the int8 model failed validation
+    """
+    from sentence_transformers import export_optimized_onnx_model, export_dynamic_quantized_onnx_model
+    
+    export_dir = ONNX_CACHE_DIR / model_name.replace('/', '--')
+    float_file = 'onnx/model_O3.onnx'
+    int8_file = 'onnx/model_O3_qint8_avx512_vnni.onnx'
+    if not (export_dir / float_file).exists():
+        print(f"  Exporting {model_name} to ONNX (first run only)...")
+        model = SentenceTransformer(model_name, backend='onnx', model_kwargs={'provider': 'CPUExecutionProvider'})
+        model.save(str(export_dir))
+        export_optimized_onnx_model(model, 'O3', str(export_dir))
+    float_model = SentenceTransformer(
+        str(export_dir), backend='onnx',
+        model_kwargs={'provider': 'CPUExecutionProvider', 'file_name': float_file}
     )
-    print("✓ SapBERT loaded")
-except Exception as e:
-    print(f"✗ Error loading SapBERT: {e}")
-    raise
-
-# Load multilingual-e5
-e5_cache = Path.home() / '.cache/huggingface/hub/models--intfloat--multilingual-e5-large'
-if e5_cache.exists():
-    size = get_cache_size(e5_cache)
-    print(f"Loading multilingual-e5 from cache ({size})...")
-else:
-    print("Loading multilingual-e5 (first run - will download ~2.4GB)...")
-
-try:
-    multilingual_e5 = SentenceTransformer(
-        'intfloat/multilingual-e5-large'
+    if not quantized:
+        return float_model, False
+    
+    if not (export_dir / int8_file).exists():
+        print(f"  Quantizing {model_name} to int8 (first run only)...")
+        export_dynamic_quantized_onnx_model(
+            float_model, 'avx512_vnni', str(export_dir), file_suffix='O3_qint8_avx512_vnni'
+        )
+    int8_model = SentenceTransformer(
+        str(export_dir), backend='onnx',
+        model_kwargs={'provider': 'CPUExecutionProvider', 'file_name': int8_file}
     )
-    print("✓ multilingual-e5 loaded")
-except Exception as e:
-    print(f"✗ Error loading multilingual-e5: {e}")
-    raise
+    
+    # Guard retrieval quality: int8 embeddings must stay close to the float ones
+    float_vecs = _encode(float_model, INT8_VALIDATION_TEXTS)
+    int8_vecs = _encode(int8_model, INT8_VALIDATION_TEXTS)
+    cosine = float(np.mean(np.sum(float_vecs * int8_vecs, axis=1)))
+    if cosine < INT8_MIN_COSINE:
+        print(f"  ! int8 {model_name} drifts from float (mean cosine {cosine:.4f}), using the float ONNX model")
+        return float_model, False
+    print(f"  int8 vs float mean cosine: {cosine:.4f}")
+    return int8_model, True
+
+
+def create_model(model_name):
+    """Instantiate an embedding model for EMBED_BACKEND"""
+    suffix = ''
+    if EMBED_BACKEND in ('onnx', 'onnx-int8'):
+        model, is_int8 = load_onnx_model(model_name, quantized=EMBED_BACKEND == 'onnx-int8')
+        if is_int8:
+            suffix += ':qint8'
+    else:
+        model = SentenceTransformer(model_name, device=DEVICE)
+        if DEVICE == 'cuda':
+            model.half()  # fp16 tensor-core matmuls
+    if EMBED_MAX_SEQ_LENGTH:
+        model.max_seq_length = min(model.max_seq_length, EMBED_MAX_SEQ_LENGTH)
+        suffix += f':len{EMBED_MAX_SEQ_LENGTH}'
+    _cache_suffixes[id(model)] = suffix
+    return model
 
-print("✓ All models loaded\n")
 
+# id(model) -> multi-process pool, filled by start_encode_pools()
+_encode_pools = {}
+
+
+def start_encode_pools(*models):
+    """Start an EMBED_PROCESSES-worker CPU pool per model; _encode() then shards across it"""
+    # Split the cores between workers so their BLAS threads don't oversubscribe the host
+    # (the spawned workers inherit the environment, not torch.set_num_threads)
+    os.environ['OMP_NUM_THREADS'] = str(max(1, (os.cpu_count() or 1) // EMBED_PROCESSES))
+    for model in models:
+        _encode_pools[id(model)] = model.start_multi_process_pool(target_devices=['cpu'] * EMBED_PROCESSES)
+    atexit.register(stop_encode_pools)
+    print(f"✓ Started {EMBED_PROCESSES} encode worker processes per model")
+
+
+def stop_encode_pools():
+    """Terminate the multi-process pools (registered with atexit)"""
+    while _encode_pools:
+        _, pool = _encode_pools.popitem()
+        SentenceTransformer.stop_multi_process_pool(pool)
+
+
+def compile_model(model, name):
+    """Compile the model's Hugging Face backbone with torch.compile and trigger compilation once"""
+    if not hasattr(torch, 'compile'):
+        print(f"  ! torch.compile unavailable (PyTorch {torch.__version__}), {name} runs eagerly")
+        return
+    # dynamic=True: sequence lengths differ per batch, avoid recompiling for every new shape
+    model[0].auto_model = torch.compile(model[0].auto_model, dynamic=True)
+    _encode(model, ["warmup"])  # same inference_mode path as the real encodes, so the graph is reused
+    print(f"✓ {name} compiled")
+
+
+def load_models():
+    """Load SapBERT and multilingual-e5 onto DEVICE"""
+    global sapbert, multilingual_e5
+    if EMBED_BACKEND in ('onnx', 'onnx-int8'):
+        print(f"\nEmbedding backend: ONNX Runtime (CPU, O3-optimized{', int8' if EMBED_BACKEND == 'onnx-int8' else ''})")
+    else:
+        print(f"\nEmbedding device: {DEVICE}{' (fp16)' if DEVICE == 'cuda' else ''}")
 
-def process_paper(paper_path):
-    """Process single paper and generate embeddings
+    # Load models (use default HuggingFace cache)
+    print("\nLoading embedding models...")
+    print("(Models are cached in ~/.cache/huggingface)")
+
+    # Load SapBERT
+    sapbert_cache = Path.home() / '.cache/huggingface/hub/models--cambridgeltl--SapBERT-from-PubMedBERT-fulltext'
+    if sapbert_cache.exists():
+        size = get_cache_size(sapbert_cache)
+        print(f"Loading SapBERT from cache ({size})...")
+    else:
+        print("Loading SapBERT (first run - will download ~420MB)...")
+
+    try:
+        sapbert = create_model('cambridgeltl/SapBERT-from-PubMedBERT-fulltext')
+        print("✓ SapBERT loaded")
+    except Exception as e:
+        print(f"✗ Error loading SapBERT: {e}")
+        raise
+
+    # Load multilingual-e5
+    e5_cache = Path.home() / '.cache/huggingface/hub/models--intfloat--multilingual-e5-large'
+    if e5_cache.exists():
+        size = get_cache_size(e5_cache)
+        print(f"Loading multilingual-e5 from cache ({size})...")
+    else:
+        print("Loading multilingual-e5 (first run - will download ~2.4GB)...")
+
+    try:
+        multilingual_e5 = create_model('intfloat/multilingual-e5-large')
+        print("✓ multilingual-e5 loaded")
+    except Exception as e:
+        print(f"✗ Error loading multilingual-e5: {e}")
+        raise
+
+    if EMBED_COMPILE and EMBED_BACKEND == 'torch':
+        compile_model(sapbert, "SapBERT")
+        compile_model(multilingual_e5, "multilingual-e5")
+
+    if EMBED_PROCESSES > 1 and EMBED_BACKEND == 'torch' and DEVICE == 'cpu':
+        start_encode_pools(sapbert, multilingual_e5)
+
+    print("✓ All models loaded\n")
+
+
+# Papers encoded together: every SapBERT / E5 input of the batch goes through one encode() call per model
+PAPER_BATCH_SIZE = int(os.getenv('EMBED_PAPER_BATCH_SIZE', '16'))
+# Sentences per forward pass inside encode() (wider on CUDA: fp16 GEMMs only saturate the GPU at larger batches)
+ENCODE_BATCH_SIZE = int(os.getenv('EMBED_ENCODE_BATCH_SIZE', '128' if DEVICE == 'cuda' and EMBED_BACKEND == 'torch' else '64'))
+
+
+# On-disk embedding cache: sha1(model + text) -> fp16 vector, so re-runs only encode new/changed texts
+EMBED_CACHE_ENABLED = os.getenv('EMBED_CACHE', '1').lower() not in ('0', 'false', 'no')
+EMBED_CACHE_PATH = Path(__file__).resolve().parent.parent / '.cache' / 'embeddings.db'
+
+_embed_cache = None
+
+
+def get_embed_cache():
+    """Open the SQLite embedding cache (created on first use)"""
+    global _embed_cache
+    if _embed_cache is None:
+        EMBED_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _embed_cache = sqlite3.connect(EMBED_CACHE_PATH)
+        _embed_cache.execute('PRAGMA journal_mode=WAL')
+        _embed_cache.execute('PRAGMA synchronous=NORMAL')
+        # float32 blobs, so cache hits return exactly what a fresh encode would
+        # (fp16 rows of the older 'vectors' table are ignored)
+        _embed_cache.execute('CREATE TABLE IF NOT EXISTS vectors_f32 (key TEXT PRIMARY KEY, vec BLOB)')
+    return _embed_cache
+
+
+def _encode(model, texts):
+    """Encode a list of texts in batched forward passes (L2-normalized float32 array, one row per text)"""
+    pool = _encode_pools.get(id(model))
+    if pool is not None:
+        vecs = model.encode_multi_process(texts, pool, batch_size=ENCODE_BATCH_SIZE)
+        vecs /= np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-12
+        return vecs.astype(np.float32, copy=False)
+    with torch.inference_mode():
+        vecs = model.encode(
+            texts,
+            batch_size=ENCODE_BATCH_SIZE,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+    # fp16 models return float16 arrays; Qdrant vectors are stored as float32
+    return vecs.astype(np.float32, copy=False)
+
+
+def encode_texts(model, texts, cache_prefix):
+    """Encode texts, reusing cached vectors and encoding only the misses in one batch
+    
+    Args:
+        model: SentenceTransformer
+        texts: list of input strings (with E5 prefixes already applied)
+        cache_prefix: model identifier used in the cache key (the loaded backend's
+            suffix, e.g. ':qint8', is appended)
     
     Returns:
-        success: bool
-        paper_id: str
-        paper_uuid: str (UUID for Qdrant)
-        points_count: int (main collection + atomic facts)
+        float32 array, one row per text
     """
+    if not EMBED_CACHE_ENABLED:
+        return _encode(model, texts)
     
-    try:
-        # Load structured data
-        with open(paper_path, 'r', encoding='utf-8') as f:
-            paper = json.load(f)
-        
-        # Extract data
-        paper_id = paper.get('paper_id', '')
-        pico = paper['language_independent_core'].get('pico_en', {})
-        atomic_facts = paper['language_independent_core'].get('atomic_facts_en', [])
-        metadata = paper.get('metadata', {})
-        
-        # Check for generated questions
-        if 'multilingual_interface' not in paper:
-            print(f"  ! Missing multilingual_interface in {paper_id}")
-            return False, None, None, 0
-        
-        generated_questions = paper['multilingual_interface'].get('generated_questions', {})
-        if isinstance(generated_questions, list):
-            questions_en = generated_questions          # flat list — already English strings
-        elif isinstance(generated_questions, dict):
-            questions_en = generated_questions.get('en', [])
-        else:
-            questions_en = []
-        
-        # 1. SapBERT PICO embedding (768 dim)
-        pico_combined = f"{pico.get('patient', '')} {pico.get('intervention', '')} {pico.get('comparison', '')} {pico.get('outcome', '')}"
-        sapbert_pico_vec = sapbert.encode(pico_combined, normalize_embeddings=True)
-        
-        # 2. E5 PICO embedding (1024 dim, with passage: prefix)
-        e5_pico_vec = multilingual_e5.encode(
-            f"passage: {pico_combined}", 
-            normalize_embeddings=True
+    db = get_embed_cache()
+    cache_prefix += _cache_suffixes.get(id(model), '')
+    keys = [f"{cache_prefix}:{hashlib.sha1(t.encode('utf-8')).hexdigest()}" for t in texts]
+    cached = {}
+    unique_keys = list(dict.fromkeys(keys))
+    # Stay under SQLite's bound-variable limit
+    for i in range(0, len(unique_keys), 500):
+        chunk = unique_keys[i:i + 500]
+        rows = db.execute(
+            f"SELECT key, vec FROM vectors_f32 WHERE key IN ({','.join('?' * len(chunk))})",
+            chunk,
         )
-        
-        # 3. E5 English questions (1024 dim, average with query: prefix)
-        if questions_en:
-            e5_q_en_vecs = [
-                multilingual_e5.encode(f"query: {q}", normalize_embeddings=True)
-                for q in questions_en
+        for key, blob in rows:
+            cached[key] = np.frombuffer(blob, dtype=np.float32)
+    
+    # Encode each missing text once
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cached:
+            missing.setdefault(key, text)
+    if missing:
+        fresh = _encode(model, list(missing.values()))
+        with db:
+            db.executemany(
+                'INSERT OR REPLACE INTO vectors_f32 (key, vec) VALUES (?, ?)',
+                [(key, vec.tobytes()) for key, vec in zip(missing, fresh)],
+            )
+        cached.update(zip(missing, fresh))
+    
+    return np.stack([cached[key] for key in keys])
+
+
+# PICO fields joined (space-separated, in this order) into the text embedded for a paper
+PICO_FIELDS = ('patient', 'intervention', 'comparison', 'outcome')
+# multilingual-e5 input prefixes: documents are "passage: ...", questions are "query: ..."
+E5_PASSAGE_PREFIX = "passage: "
+E5_QUERY_PREFIX = "query: "
+
+
+@lru_cache(maxsize=None)
+def load_abstracts(papers_json_path):
+    """PMID -> abstract of a subsection's papers.json, parsed once per run instead of once per paper
+    
+    papers.json grows to MBs once full text is appended, and every paper of the
+    subsection needs only its own abstract from it.
+    """
+    abstracts = {}
+    if papers_json_path.exists():
+        for raw in orjson.loads(papers_json_path.read_bytes()):
+            abstracts.setdefault(str(raw.get('pmid', '')), raw.get('abstract', ''))
+    return abstracts
+
+
+def load_paper(paper_path):
+    """Load a structured paper and collect the texts to embed
+    
+    Returns:
+        dict with paper fields and texts, or None if the paper cannot be embedded
+    """
+    # Load structured data (orjson decodes the UTF-8 bytes directly)
+    paper = orjson.loads(paper_path.read_bytes())
+    
+    # Extract data
+    paper_id = paper.get('paper_id', '')
+    pico = paper['language_independent_core'].get('pico_en', {})
+    atomic_facts = paper['language_independent_core'].get('atomic_facts_en', [])
+    metadata = paper.get('metadata', {})
+    
+    # Check for generated questions
+    if 'multilingual_interface' not in paper:
+        print(f"  ! Missing multilingual_interface in {paper_id}")
+        return None
+    
+    generated_questions = paper['multilingual_interface'].get('generated_questions', {})
+    if isinstance(generated_questions, list):
+        questions_en = generated_questions          # flat list — already English strings
+    elif isinstance(generated_questions, dict):
+        questions_en = generated_questions.get('en', [])
+    else:
+        questions_en = []
+
+    # Look up abstract from papers.json in parent subsection directory
+    abstracts = load_abstracts(paper_path.parent.parent / 'papers.json')
+    abstract = abstracts.get(str(paper_id).replace('PMID_', ''), '')
+
+    if not abstract:
+        print(f"  Skipping {paper_id}: no abstract found")
+        return None
+
+    return {
+        'paper_path': paper_path,
+        'paper_id': paper_id,
+        'pico': pico,
+        'pico_combined': ' '.join(str(pico.get(field, '')) for field in PICO_FIELDS),
+        'atomic_facts': atomic_facts,
+        'questions_en': questions_en,
+        'metadata': metadata,
+        'abstract': abstract,
+    }
+
+
+def load_batch(paper_paths):
+    """Load the papers of a batch (runs on the prefetch thread)
+    
+    Returns:
+        (papers, failure): loaded papers up to the first one that cannot be
+        embedded, and that paper's (False, paper_id, None, 0) result or None
+    """
+    papers = []
+    for paper_path in paper_paths:
+        try:
+            paper = load_paper(paper_path)
+        except Exception as e:
+            print(f"  ✗ Error processing {paper_path.name}: {e}")
+            paper = None
+        if paper is None:
+            return papers, (False, paper_path.stem, None, 0)
+        papers.append(paper)
+    return papers, None
+
+
+def encode_batch(papers):
+    """Generate embeddings for a batch of loaded papers and build their Qdrant points
+    
+    All SapBERT inputs (PICO + atomic facts) and all E5 inputs (passage: PICO +
+    query: questions) of the batch are encoded with a single encode() call per
+    model, then sliced back per paper. Stops at the first paper that fails.
+    
+    Returns:
+        (main_batch, atomic_batch, results): a models.Batch per collection (None if
+        empty) and a list of (success, paper_id, paper_uuid, points_count) per processed paper
+    """
+    if not papers:
+        return None, None, []
+    
+    # Build one input list per model, remembering each paper's offsets
+    sapbert_texts = []
+    e5_texts = []
+    for paper in papers:
+        paper['sapbert_start'] = len(sapbert_texts)
+        sapbert_texts.append(paper['pico_combined'])
+        sapbert_texts.extend(paper['atomic_facts'])
+        paper['e5_start'] = len(e5_texts)
+        e5_texts.append(E5_PASSAGE_PREFIX + paper['pico_combined'])
+        e5_texts.extend([E5_QUERY_PREFIX + q for q in paper['questions_en']])
+    
+    results = []
+    try:
+        sapbert_vecs = encode_texts(sapbert, sapbert_texts, 'sapbert')
+        e5_vecs = encode_texts(multilingual_e5, e5_texts, 'e5')
+    except Exception as e:
+        print(f"  ✗ Error encoding batch starting at {papers[0]['paper_path'].name}: {e}")
+        return None, None, [(False, papers[0]['paper_path'].stem, None, 0)]
+    
+    # Convert each float32 matrix to Python rows in one C-level pass; qdrant-client's
+    # pydantic models would otherwise coerce ndarray vectors element by element (slower)
+    sapbert_rows = sapbert_vecs.tolist()
+    e5_rows = e5_vecs.tolist()
+    
+    # Points of the whole batch in column layout (ids / per-name vector lists / payloads),
+    # upserted as one models.Batch per collection
+    main_ids, main_payloads = [], []
+    main_vectors = {"sapbert_pico": [], "e5_pico": [], "e5_questions_en": []}
+    atomic_ids, atomic_payloads, atomic_vectors = [], [], []
+    for paper in papers:
+        paper_path = paper['paper_path']
+        paper_id = paper['paper_id']
+        try:
+            n_facts = len(paper['atomic_facts'])
+            n_questions = len(paper['questions_en'])
+            
+            # 1. SapBERT PICO embedding (768 dim) + 4. atomic fact embeddings
+            s = paper['sapbert_start']
+            sapbert_pico_vec = sapbert_rows[s]
+            fact_vecs = sapbert_rows[s + 1:s + 1 + n_facts]
+            
+            # 2. E5 PICO embedding (1024 dim, with passage: prefix)
+            e = paper['e5_start']
+            e5_pico_vec = e5_rows[e]
+            
+            # 3. E5 English questions (1024 dim, average with query: prefix)
+            # The question rows were encoded in the same batched forward pass; re-normalize the
+            # mean so it stays a unit vector in cosine space
+            if n_questions:
+                e5_questions_en_vec = e5_vecs[e + 1:e + 1 + n_questions].mean(axis=0)
+                e5_questions_en_vec /= np.linalg.norm(e5_questions_en_vec) + 1e-12
+                e5_questions_en_vec = e5_questions_en_vec.tolist()
+            else:
+                e5_questions_en_vec = [0.0] * 1024
+
+            paper_uuid = paper_point_id(paper_id)
+            json_path = str(paper_path)  # shared by the paper and all of its fact payloads
+            payload = {
+                "json_path": json_path,
+                "paper_id": paper_id,
+                "pico_en": paper['pico'],
+                "metadata": paper['metadata'],
+                "mesh_terms": paper['metadata'].get('mesh_terms', []),
+                "abstract": paper['abstract'],
+            }
+            
+            # 6. Atomic facts (separate collection, 1 named vector per fact)
+            fact_ids = [str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{paper_id}_fact_{idx}")) for idx in range(len(fact_vecs))]
+            fact_payloads = [
+                {
+                    "json_path": json_path,
+                    "paper_id": paper_id,
+                    "fact_text": fact,
+                    "fact_index": idx
+                }
+                for idx, fact in enumerate(paper['atomic_facts'][:len(fact_vecs)])
             ]
-            e5_questions_en_vec = np.mean(e5_q_en_vecs, axis=0)
-        else:
-            e5_questions_en_vec = np.zeros(1024, dtype=np.float32)
-        
+            
+            # 5. medical_papers collection point (3 named vectors); columns are only
+            # extended once the whole paper succeeded so they stay aligned
+            main_ids.append(paper_uuid)
+            main_vectors["sapbert_pico"].append(sapbert_pico_vec)
+            main_vectors["e5_pico"].append(e5_pico_vec)
+            main_vectors["e5_questions_en"].append(e5_questions_en_vec)
+            main_payloads.append(payload)
+            atomic_ids.extend(fact_ids)
+            atomic_vectors.extend(fact_vecs)
+            atomic_payloads.extend(fact_payloads)
+            
+            results.append((True, paper_id, paper_uuid, 1 + n_facts))
+            
+        except Exception as e:
+            print(f"  ✗ Error processing {paper_path.name}: {e}")
+            results.append((False, paper_path.stem, None, 0))
+            break
+    
+    main_batch = Batch(ids=main_ids, vectors=main_vectors, payloads=main_payloads) if main_ids else None
+    atomic_batch = Batch(ids=atomic_ids, vectors={"sapbert_fact": atomic_vectors}, payloads=atomic_payloads) if atomic_ids else None
+    return main_batch, atomic_batch, results
 
-        # Deterministic UUID from paper_id: re-runs update the same point, no duplicates
-        paper_uuid = str(uuid.uuid5(uuid.NAMESPACE_DNS, paper_id))
-
-        # Look up abstract from papers.json in parent subsection directory
-        abstract = ''
-        papers_json_path = paper_path.parent.parent / 'papers.json'
-        if papers_json_path.exists():
-            papers_raw = json.loads(papers_json_path.read_text(encoding='utf-8'))
-            for raw in papers_raw:
-                pmid_numeric = str(paper_id).replace('PMID_', '')
-                if str(raw.get('pmid', '')) == pmid_numeric:
-                    abstract = raw.get('abstract', '')
-                    break
 
-        if not abstract:
-            print(f"  Skipping {paper_id}: no abstract found")
-            return False
+def paper_point_id(paper_id):
+    """Deterministic UUID from paper_id: re-runs update the same point, no duplicates"""
+    return str(uuid.uuid5(uuid.NAMESPACE_DNS, paper_id))
+
+
+# Point ids per retrieve() request in the existence check
+EXISTENCE_CHECK_CHUNK = 1000
+
 
-        # 5. Upsert to medical_papers collection (3 named vectors)
-        client.upsert(
+def find_existing_point_ids(point_ids):
+    """Return the subset of point_ids already stored in medical_papers
+    
+    Retrieves ids only (no payload, no vectors), so the check costs O(local papers)
+    instead of downloading every point's payload.
+    """
+    existing = set()
+    for i in range(0, len(point_ids), EXISTENCE_CHECK_CHUNK):
+        points = client.retrieve(
             collection_name="medical_papers",
-            points=[
-                PointStruct(
-                    id=paper_uuid,
-                    vector={
-                        "sapbert_pico": sapbert_pico_vec.tolist(),
-                        "e5_pico": e5_pico_vec.tolist(),
-                        "e5_questions_en": e5_questions_en_vec.tolist()
-                    },
-                    payload={
-                        "json_path": str(paper_path),
-                        "paper_id": paper_id,
-                        "pico_en": pico,
-                        "metadata": metadata,
-                        "mesh_terms": metadata.get('mesh_terms', []),
-                        "abstract": abstract,
-                    }
-                )
-            ]
-        )
-        
-        # 6. Atomic facts (separate collection, 1 named vector per fact)
-        atomic_points = []
-        for idx, fact in enumerate(atomic_facts):
-            fact_uuid = str(uuid.uuid5(uuid.NAMESPACE_DNS, f"{paper_id}_fact_{idx}"))
-            fact_vec = sapbert.encode(fact, normalize_embeddings=True)
-            atomic_points.append(
-                PointStruct(
-                    id=fact_uuid,
-                    vector={"sapbert_fact": fact_vec.tolist()},
-                    payload={
-                        "json_path": str(paper_path),
-                        "paper_id": paper_id,
-                        "fact_text": fact,
-                        "fact_index": idx
-                    }
-                )
-            )
-        
-        client.upsert(
-            collection_name="atomic_facts",
-            points=atomic_points
+            ids=point_ids[i:i + EXISTENCE_CHECK_CHUNK],
+            with_payload=False,
+            with_vectors=False
         )
-        
-        return True, paper_id, paper_uuid, 1 + len(atomic_points)
-        
+        existing.update(str(point.id) for point in points)
+    return existing
+
+
+def upsert_batch(main_batch, atomic_batch, wait=True):
+    """Upsert a batch: one request per collection instead of two per paper (runs on the upload thread)
+    
+    Args:
+        wait: False returns once Qdrant has accepted the update (WAL) instead of
+            after it is applied; updates are still applied in submission order
+    
+    Returns:
+        True on success
+    """
+    try:
+        if main_batch is not None:
+            client.upsert(collection_name="medical_papers", points=main_batch, wait=wait)
+        if atomic_batch is not None:
+            client.upsert(collection_name="atomic_facts", points=atomic_batch, wait=wait)
+        return True
     except Exception as e:
-        print(f"  ✗ Error processing {paper_path.name}: {e}")
-        return False, paper_path.stem, None, 0
+        print(f"  ✗ Error upserting batch: {e}")
+        return False
 
 
 def main():
@@ -292,7 +709,7 @@ def main():
     global client
     client, mode = initialize_qdrant_client(use_cloud=args.cloud)
     
-    print(f"\nMode: {'Qdrant Cloud' if mode == 'cloud' else 'Local'}")
+    print(f"\nMode: {'Qdrant Cloud' if mode == 'cloud' else 'Qdrant server' if mode == 'server' else 'Local'}")
     
     # Setup collections (create if they don't exist)
     setup_collections(client)
@@ -300,47 +717,30 @@ def main():
     # Check which papers actually have embeddings in Qdrant
     print("\nChecking Qdrant for existing embeddings...\n")
     
+    qdrant_ok = True
     try:
-        # Get existing papers in Qdrant
+        # Number of papers in Qdrant (one medical_papers point per paper)
         medical_info = client.get_collection("medical_papers")
+        existing_count = medical_info.points_count or 0
         
-        # Get all existing PMIDs
-        existing_pmids = set()
-        scroll_result = client.scroll(
-            collection_name="medical_papers",
-            limit=10000,
-            with_payload=True,
-            with_vectors=False
-        )
-        
-        for point in scroll_result[0]:
-            pmid = point.payload.get('paper_id', '')
-            if pmid:
-                existing_pmids.add(pmid)
-        
-        print(f"Existing papers in Qdrant: {len(existing_pmids)}")
+        print(f"Existing papers in Qdrant: {existing_count}")
         
     except Exception as e:
         print(f"✗ Error checking Qdrant: {e}")
-        existing_pmids = set()
+        existing_count = 0
+        qdrant_ok = False
     
     # If --check flag is set, only check and exit
     if args.check:
         print(f"\n{'='*70}")
         print("Check Mode - Exiting without generating embeddings")
         print(f"{'='*70}")
-        print(f"Existing papers in database: {len(existing_pmids)}")
+        print(f"Existing papers in database: {existing_count}")
         return
     
     # Find all structured papers across all 3 domains and subsections
     all_papers = []
     
-    SUBSECTIONS = {
-        'pharmacologic': ['glp1_receptor_agonists', 'guidelines_and_reviews', 'novel_agents'],
-        'surgical': ['procedures_and_outcomes', 'metabolic_effects', 'complications_safety'],
-        'lifestyle': ['dietary_interventions', 'physical_activity', 'behavioral_therapy']
-    }
-    
     for domain in ['pharmacologic', 'surgical', 'lifestyle']:
         domain_papers = 0
         
@@ -360,17 +760,27 @@ def main():
     total_papers = len(all_papers)
     print(f"\nTotal papers to process: {total_papers}")
     
-    # Determine which papers need to be processed
-    papers_to_process = [((domain, subsection), pf) for (domain, subsection), pf in all_papers if pf.stem.replace('PMID_', '') not in existing_pmids]
+    # Determine which papers need to be processed: look up the local papers' point ids
+    # (file stem == paper_id, e.g. PMID_12345) instead of scrolling the whole collection
+    point_ids = [paper_point_id(pf.stem) for _, pf in all_papers]
+    existing_ids = set()
+    if qdrant_ok and existing_count:
+        try:
+            existing_ids = find_existing_point_ids(point_ids)
+        except Exception as e:
+            print(f"✗ Error checking Qdrant: {e}")
+    papers_to_process = [paper for paper, point_id in zip(all_papers, point_ids) if point_id not in existing_ids]
     
     print(f"Papers to process: {len(papers_to_process)}")
-    print(f"Already have embeddings: {len(existing_pmids)}\n")
+    print(f"Already have embeddings: {total_papers - len(papers_to_process)}\n")
     
     if len(papers_to_process) == 0:
         print("All papers already have embeddings in Qdrant!")
         print("No processing needed.")
         return
     
+    load_models()
+    
     # Process all papers that don't have embeddings
     print(f"Processing {len(papers_to_process)} papers...\n")
     
@@ -382,29 +792,72 @@ def main():
     
     start_time = time.time()
     
-    for idx, ((domain, subsection), paper_file) in enumerate(papers_to_process, 1):
-        paper_id = paper_file.stem.replace('PMID_', '')
-        
-        print(f"[{idx}/{len(papers_to_process)}] {domain}/{subsection}/{paper_file.name} - Generating embeddings...")
-        
-        success, paper_id, paper_uuid, points = process_paper(paper_file)
+    def record(results, batch_start):
+        """Count a finished batch; False once a paper failed (stop on error)"""
+        nonlocal success_count, error_count, total_main_points, total_atomic_points
+        for idx, (success, paper_id, paper_uuid, points) in enumerate(results, batch_start + 1):
+            if success:
+                success_count += 1
+                total_main_points += 1
+                total_atomic_points += points
+                
+                if idx % 10 == 0 or idx == len(papers_to_process):
+                    elapsed = time.time() - start_time
+                    progress = (idx / len(papers_to_process)) * 100
+                    print(f"  Progress: {progress:.1f}% | Success: {success_count} | Time: {elapsed:.1f}s | Main: {total_main_points} | Atomic: {total_atomic_points}")
+            else:
+                error_count += 1
+                print(f"  ✗ Failed to generate embeddings for {paper_id}")
+                
+                # Stop on error
+                print(f"\n✗ Error detected. Stopping processing.")
+                return False
+        return True
+    
+    def finish_upload(pending):
+        """Wait for a batch's upsert, then count its results"""
+        future, results, batch_start, batch = pending
+        if not future.result():
+            results = [(False, batch[0][1].stem, None, 0)]
+        return record(results, batch_start)
+    
+    # Pipeline: the next batch's JSON is loaded and the previous batch is upserted
+    # on background threads while the current batch is being encoded
+    batches = [
+        (batch_start, papers_to_process[batch_start:batch_start + PAPER_BATCH_SIZE])
+        for batch_start in range(0, len(papers_to_process), PAPER_BATCH_SIZE)
+    ]
+    with ThreadPoolExecutor(max_workers=1) as loader, ThreadPoolExecutor(max_workers=1) as uploader:
+        next_load = loader.submit(load_batch, [pf for _, pf in batches[0][1]])
+        pending = None
         
-        if success:
-            success_count += 1
-            total_main_points += 1
-            total_atomic_points += points
+        for b, (batch_start, batch) in enumerate(batches):
+            for idx, ((domain, subsection), paper_file) in enumerate(batch, batch_start + 1):
+                print(f"[{idx}/{len(papers_to_process)}] {domain}/{subsection}/{paper_file.name} - Generating embeddings...")
             
-            if idx % 10 == 0 or idx == len(papers_to_process):
-                elapsed = time.time() - start_time
-                progress = (idx / len(papers_to_process)) * 100
-                print(f"  Progress: {progress:.1f}% | Success: {success_count} | Time: {elapsed:.1f}s | Main: {total_main_points} | Atomic: {total_atomic_points}")
-        else:
-            error_count += 1
-            print(f"  ✗ Failed to generate embeddings for {paper_id}")
+            papers, load_failure = next_load.result()
+            if load_failure is None and b + 1 < len(batches):
+                next_load = loader.submit(load_batch, [pf for _, pf in batches[b + 1][1]])
             
-            # Stop on error
-            print(f"\n✗ Error detected. Stopping processing.")
-            break
+            main_batch, atomic_batch, results = encode_batch(papers)
+            if load_failure and (not results or results[-1][0]):
+                results.append(load_failure)
+            
+            # Keep upserts in order: the previous batch must be stored before queueing this one
+            if pending:
+                ok = finish_upload(pending)
+                pending = None
+                if not ok:
+                    break
+            
+            # Only the last batch waits until applied, so the verification below sees every point
+            last = b + 1 == len(batches)
+            pending = (uploader.submit(upsert_batch, main_batch, atomic_batch, last), results, batch_start, batch)
+            if results and not results[-1][0]:
+                break
+        
+        if pending:
+            finish_upload(pending)
     
     elapsed_time = time.time() - start_time
     
@@ -432,7 +885,7 @@ def main():
         print(f"  Points: {medical_info.points_count}")
         
         # Get total after upsert
-        total_expected = success_count + len(existing_pmids)
+        total_expected = success_count + existing_count
         if medical_info.points_count == total_expected:
             print(f"  ✓ All {total_expected} papers in database")
         else:
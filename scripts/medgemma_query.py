@@ -10,6 +10,10 @@ import time
 import argparse
 import re
 import os
+from functools import lru_cache
+
+# Hiragana / Katakana / CJK ideographs
+JAPANESE_RE = re.compile(r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]')
 
 def query_ollama(prompt, model="medgemma", temperature=0.0, progress_cb=None):
     """
@@ -152,26 +156,32 @@ def translate_to_japanese(text, debug=False):
             print(f"[WARNING] JP translation failed: {e}")
         return text
 
-def translate_query(query, debug=False):
-    """Translate JP query to EN using OpenRouter Gemma 3 27B."""
-    if not re.search(r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]', query):
-        return query
+@lru_cache(maxsize=1024)
+def _translate_query_cached(query):
+    """Translate a JP query via OpenRouter. Raises on failure so failures are not cached."""
     messages = [
         {"role": "system", "content": "You are a translator. Translate the user's Japanese medical question to English. Output ONLY the English translation, no explanations."},
         {"role": "user", "content": query}
     ]
+    text = _query_openrouter(messages, max_tokens=128)
+    if "\n" in text:
+        text = text.split("\n")[0].strip()
+    if JAPANESE_RE.search(text):
+        raise ValueError(f"Translation still contains Japanese: {text}")
+    return text
+
+def translate_query(query, debug=False):
+    """Translate JP query to EN using OpenRouter Gemma 3 27B (cached per query)."""
+    if not JAPANESE_RE.search(query):
+        return query
     if debug:
         print("\n====== DEBUG: Translation (OpenRouter) ======")
         print(f"Input: {query}")
     try:
-        text = _query_openrouter(messages, max_tokens=128)
-        if "\n" in text:
-            text = text.split("\n")[0].strip()
+        text = _translate_query_cached(query.strip())
         if debug:
             print(f"Output: {text}")
             print("=============================================\n")
-        if re.search(r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]', text):
-            return query
         return text
     except Exception as e:
         if debug:
@@ -398,7 +408,7 @@ def run_map_reduce_query(query, verbose=False, debug=False, use_cloud=False, use
     # 1. 翻訳 & 検索
     query_en = translate_query(query, debug=debug)
 
-    if debug and re.search(r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]', query_en):
+    if debug and JAPANESE_RE.search(query_en):
         print("[WARNING] Translation failed — query_en still contains Japanese")
 
     if verbose: print(f"Translated: {query_en}")
@@ -408,7 +418,7 @@ def run_map_reduce_query(query, verbose=False, debug=False, use_cloud=False, use
     papers = search_results['papers']
 
     if not papers:
-        is_japanese = bool(re.search(r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]', query))
+        is_japanese = JAPANESE_RE.search(query) is not None
         msg = "関連する論文が見つかりませんでした。" if is_japanese else "No relevant papers were found."
         return msg, []
 
@@ -445,7 +455,7 @@ def run_map_reduce_query(query, verbose=False, debug=False, use_cloud=False, use
 
     # 4. Reduceフェーズ（英語クエリでプロンプト作成）
     print(f"4. Synthesizing {len(valid_findings)} findings (Reduce phase)...")
-    is_japanese = bool(re.search(r'[\u3040-\u309F\u30A0-\u30FF\u4E00-\u9FFF]', query))
+    is_japanese = JAPANESE_RE.search(query) is not None
     final_answer = synthesize_findings(valid_findings, query_en, debug=debug, use_hf=use_hf)
 
     # 5. 日本語クエリの場合は回答を日本語に翻訳
@@ -11,6 +11,9 @@ import sys
 from qdrant_client import QdrantClient
 from qdrant_client.models import PointStruct
 
+# scroll 1回あたりの取得件数 (1ページ分をそのまま1回のupsertで送る)
+SCROLL_PAGE_SIZE = 100
+
 
 def migrate_collection(source_url, dest_url, collection_name):
     """コレクションをsourceからdestへコピー"""
@@ -19,21 +22,21 @@ def migrate_collection(source_url, dest_url, collection_name):
     source_client = QdrantClient(url=source_url)
     dest_client = QdrantClient(url=dest_url)
 
-    # Sourceからすべてのポイントを取得
-    scroll_result = source_client.scroll(
+    # Sourceのポイントはページ単位で取得する (limit=10000 の一括取得では1万件を超えた分が欠落する)
+    points, next_offset = source_client.scroll(
         collection_name=collection_name,
-        limit=10000,
+        limit=SCROLL_PAGE_SIZE,
         with_payload=True,
         with_vectors=True
     )
 
-    points = scroll_result[0]
-    print(f"Found {len(points)} points to migrate")
-
     if len(points) == 0:
         print("No points to migrate")
         return
 
+    total_points = source_client.count(collection_name=collection_name, exact=True).count
+    print(f"Found {total_points} points to migrate")
+
     # Destinationにコレクションを作成（既存の場合は削除して再作成）
     try:
         dest_client.delete_collection(collection_name)
@@ -52,29 +55,28 @@ def migrate_collection(source_url, dest_url, collection_name):
     )
     print(f"Created collection: {collection_name}")
 
-    # ポイントをアップロード
-    batch_size = 100
-    for i in range(0, len(points), batch_size):
-        batch = points[i:i+batch_size]
-
-        # ポイントをPointStructに変換
-        point_structs = []
-        for point in batch:
-            if isinstance(point, PointStruct):
-                point_structs.append(point)
-            else:
-                # 既存のポイント形式を変換
-                point_structs.append(PointStruct(
-                    id=point.id,
-                    vector=point.vector,
-                    payload=point.payload
-                ))
-
+    # ページごとにアップロードし、次のページを取得 (全件をメモリに載せない)
+    uploaded = 0
+    while True:
         dest_client.upsert(
             collection_name=collection_name,
-            points=point_structs
+            points=[
+                PointStruct(id=point.id, vector=point.vector, payload=point.payload)
+                for point in points
+            ]
+        )
+        uploaded += len(points)
+        print(f"Uploaded {uploaded}/{total_points} points")
+
+        if next_offset is None:
+            break
+        points, next_offset = source_client.scroll(
+            collection_name=collection_name,
+            limit=SCROLL_PAGE_SIZE,
+            offset=next_offset,
+            with_payload=True,
+            with_vectors=True
         )
-        print(f"Uploaded {min(i+batch_size, len(points))}/{len(points)} points")
 
     print(f"Migration complete: {collection_name}")
 
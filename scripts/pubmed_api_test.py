@@ -4,8 +4,10 @@ PubMed E-utilities API テストプログラム (with API Key)
 """
 
 import requests
+import threading
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
 from dotenv import load_dotenv
 
@@ -16,6 +18,7 @@ class PubMedClient:
     """PubMed API クライアント"""
     
     BASE_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
+    ID_BATCH_SIZE = 200  # esummary / efetch のIDは1リクエスト200件まで
     
     def __init__(self, email: str = None, api_key: str = None):
         """
@@ -35,13 +38,18 @@ class PubMedClient:
             print(f"⚠️ APIキーなし: 3 requests/second")
         
         self.last_request_time = 0
+        self._rate_lock = threading.Lock()
+        # Keep-alive: reuse the TLS connection to eutils across requests
+        self._session = requests.Session()
         
     def _rate_limit(self):
-        """レート制限を適用"""
-        elapsed = time.time() - self.last_request_time
-        if elapsed < self.request_interval:
-            time.sleep(self.request_interval - elapsed)
-        self.last_request_time = time.time()
+        """レート制限を適用（スレッドセーフ: 送信枠をロック内で予約し、待機はロック外で行う）"""
+        with self._rate_lock:
+            slot = max(time.time(), self.last_request_time + self.request_interval)
+            self.last_request_time = slot
+        delay = slot - time.time()
+        if delay > 0:
+            time.sleep(delay)
         
     def _make_request(self, endpoint: str, params: Dict) -> Dict:
         """API リクエストを実行"""
@@ -54,7 +62,7 @@ class PubMedClient:
         params['retmode'] = 'json'
         
         url = f"{self.BASE_URL}{endpoint}"
-        response = requests.get(url, params=params)
+        response = self._session.get(url, params=params)
         response.raise_for_status()
         
         return response.json()
@@ -86,6 +94,34 @@ class PubMedClient:
             'retmax': int(search_result.get('retmax', 0))
         }
     
+    def search_many(self, queries: List[str], max_results: int = 10, max_workers: int = 10) -> List[Dict]:
+        """
+        複数クエリを並列に検索（レート制限の範囲で最大 max_workers 件を同時に送信）
+
+        Args:
+            queries: 検索クエリのリスト
+            max_results: クエリごとの最大取得件数
+            max_workers: 同時リクエスト数
+
+        Returns:
+            検索結果のリスト（queries と同じ順序）
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda q: self.search(q, max_results=max_results), queries))
+
+    def _fetch_in_batches(self, fetch_batch, pmids: List[str], max_workers: int = 10) -> List[Dict]:
+        """
+        PMIDを ID_BATCH_SIZE 件ずつに分割し、バッチを並列に取得
+
+        Returns:
+            各バッチの結果を連結したリスト（PMIDの入力順）
+        """
+        batches = [pmids[i:i + self.ID_BATCH_SIZE] for i in range(0, len(pmids), self.ID_BATCH_SIZE)]
+        if len(batches) == 1:
+            return fetch_batch(batches[0])
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+            return [item for result in executor.map(fetch_batch, batches) for item in result]
+
     def fetch_summary(self, pmids: List[str]) -> List[Dict]:
         """
         論文のサマリー情報を取得
@@ -99,6 +135,10 @@ class PubMedClient:
         if not pmids:
             return []
         
+        return self._fetch_in_batches(self._fetch_summary_batch, pmids)
+
+    def _fetch_summary_batch(self, pmids: List[str]) -> List[Dict]:
+        """ID_BATCH_SIZE 件以下のPMIDについてサマリー情報を取得"""
         params = {
             'db': 'pubmed',
             'id': ','.join(pmids),
@@ -221,8 +261,9 @@ def test_speed_comparison():
     ]
     
     start_time = time.time()
-    for query in queries:
-        result = client.search(query, max_results=1)
+    # レート制限内で並列送信（逐次だと待機時間 + 応答時間が積み上がる）
+    results = client.search_many(queries, max_results=1)
+    for query, result in zip(queries, results):
         print(f"  {query}: {result['count']:,} 件")
     
     elapsed = time.time() - start_time
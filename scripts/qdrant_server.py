@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Shared connection to a self-hosted Qdrant server (QDRANT_URL)
+Used by the app (search_qdrant.py) and the indexing / verification scripts,
+so that with QDRANT_URL set they all read and write the same store.
+- QDRANT_URL unset: callers keep their own embedded ./qdrant_medical_db or
+  Qdrant Cloud behaviour
+- The server keeps its data in its own volume (docker-compose: ./qdrant_storage);
+  never point it at ./qdrant_medical_db, whose on-disk format is the embedded engine's
+"""
+
+import os
+
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+
+load_dotenv()
+
+# Optional Qdrant server (e.g. docker-compose qdrant service) shared by all workers and scripts
+QDRANT_URL = os.getenv('QDRANT_URL')
+# gRPC transport (port 6334) for server / cloud clients: smaller frames for vector payloads
+QDRANT_PREFER_GRPC = os.getenv('QDRANT_PREFER_GRPC', '').lower() in ('1', 'true', 'yes')
+
+
+def connect_qdrant_server():
+    """Return a client for the QDRANT_URL server, or None when QDRANT_URL is not set"""
+    if not QDRANT_URL:
+        return None
+    print(f"Connecting to Qdrant server at {QDRANT_URL}...")
+    client = QdrantClient(url=QDRANT_URL, prefer_grpc=QDRANT_PREFER_GRPC)
+    print("✓ Connected to Qdrant server")
+    return client
@@ -16,8 +16,12 @@ import logging
 import re
 import requests
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
+from qdrant_server import QDRANT_URL, QDRANT_PREFER_GRPC, connect_qdrant_server
 
 # Load environment variables from .env file
 load_dotenv()
@@ -27,10 +31,14 @@ OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
 SAPBERT_ENDPOINT = os.getenv('SAPBERT_ENDPOINT')
 HF_TOKEN = os.getenv('HF_TOKEN')
 
+
 def initialize_qdrant_client(force_cloud=False):
-    """Initialize Qdrant client - auto-detect local or cloud"""
+    """Initialize Qdrant client - QDRANT_URL server, local path, or cloud"""
     local_path = "./qdrant_medical_db"
     
+    if QDRANT_URL and not force_cloud:
+        return connect_qdrant_server(), "server"
+    
     # If force_cloud is True, skip local check and use cloud
     if force_cloud:
         print("Forcing Qdrant Cloud mode (--cloud flag specified)...")
@@ -56,7 +64,7 @@ def initialize_qdrant_client(force_cloud=False):
         sys.exit(1)
     
     print(f"  Endpoint: {cloud_url}")
-    client = QdrantClient(url=cloud_url, api_key=cloud_api_key)
+    client = QdrantClient(url=cloud_url, api_key=cloud_api_key, prefer_grpc=QDRANT_PREFER_GRPC)
     print("✓ Connected to Qdrant Cloud")
     return client, "cloud"
 
@@ -64,11 +72,53 @@ def initialize_qdrant_client(force_cloud=False):
 # Global variables
 client = None
 qdrant_mode = None
+_client_lock = threading.Lock()
+
+
+def get_qdrant_client():
+    """
+    Return the process-wide Qdrant client (QDRANT_URL server if set, else
+    Qdrant Cloud), creating it on first use. Reused by every search and
+    /api/status so connections stay pooled.
+    """
+    global client, qdrant_mode
+    with _client_lock:
+        if client is None:
+            client, qdrant_mode = initialize_qdrant_client(force_cloud=not QDRANT_URL)
+        return client, qdrant_mode
+
+
+class EmbeddingLRU:
+    """Small thread-safe LRU of query text -> embedding (avoids repeat API calls)"""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            vec = self._data.get(key)
+            if vec is None:
+                return None
+            self._data.move_to_end(key)
+            return vec.copy()
+
+    def put(self, key, vec):
+        with self._lock:
+            self._data[key] = vec.copy()
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+_e5_cache = EmbeddingLRU()
+_sapbert_cache = EmbeddingLRU()
 
 
 def encode_via_openrouter(text):
     """
-    Generate E5 embedding using OpenRouter API
+    Generate E5 embedding using OpenRouter API (cached per text)
     
     Args:
         text: Text to encode (use "query: <text>" prefix for queries)
@@ -76,6 +126,11 @@ def encode_via_openrouter(text):
     Returns:
         numpy array of embedding (1024-dim)
     """
+    text = text.strip()
+    cached = _e5_cache.get(text)
+    if cached is not None:
+        return cached
+
     if not OPENROUTER_API_KEY:
         raise RuntimeError("OPENROUTER_API_KEY not set in .env")
     
@@ -96,8 +151,9 @@ def encode_via_openrouter(text):
         response = requests.post(url, headers=headers, json=payload, timeout=30)
         response.raise_for_status()
         data = response.json()
-        embedding = data['data'][0]['embedding']
-        return np.array(embedding, dtype=np.float32)
+        embedding = np.array(data['data'][0]['embedding'], dtype=np.float32)
+        _e5_cache.put(text, embedding)
+        return embedding
     
     except requests.exceptions.RequestException as e:
         logging.error(f"OpenRouter API error: {e}")
@@ -107,6 +163,7 @@ def encode_via_openrouter(text):
 def encode_via_hf_dedicated(text, max_retries=3, progress_cb=None):
     """
     Generate SapBERT embedding using HF Dedicated Endpoint with retry logic for cold start
+    (cached per text, so repeated queries skip the endpoint entirely)
 
     Args:
         text: Text to encode
@@ -116,6 +173,11 @@ def encode_via_hf_dedicated(text, max_retries=3, progress_cb=None):
     Returns:
         numpy array of embedding (768-dim)
     """
+    text = text.strip()
+    cached = _sapbert_cache.get(text)
+    if cached is not None:
+        return cached
+
     if not SAPBERT_ENDPOINT:
         raise RuntimeError("SAPBERT_ENDPOINT not set in .env")
 
@@ -177,7 +239,9 @@ def encode_via_hf_dedicated(text, max_retries=3, progress_cb=None):
             else:
                 raise RuntimeError(f"Unexpected response format: {type(data)}")
             
-            return np.array(embedding, dtype=np.float32)
+            embedding = np.array(embedding, dtype=np.float32)
+            _sapbert_cache.put(text, embedding)
+            return embedding
         
         except requests.exceptions.RequestException as e:
             if attempt < max_retries - 1:
@@ -241,6 +305,109 @@ def cosine_similarity(X, Y):
     return np.dot(X_norm, Y_norm.T)
 
 
+# In-process collection snapshots: the collections are only rewritten by the
+# offline indexer, so each query reuses one scroll instead of re-downloading
+# every point. Vectors are kept as a single L2-normalized float32 matrix
+# (half of float64, cosine = one matrix-vector product).
+SNAPSHOT_TTL = int(os.getenv('QDRANT_SNAPSHOT_TTL', '600'))
+SNAPSHOT_PAGE_SIZE = 1000
+_snapshot_lock = threading.Lock()  # guards _snapshots / _snapshot_load_locks only
+_snapshot_load_locks = {}  # collection -> lock held while that collection is (re)loaded
+_snapshots = {}
+
+
+def _scroll_all_points(client, collection_name):
+    """Page through a whole collection with next_offset (a single scroll is truncated at its limit)."""
+    points, next_offset = client.scroll(
+        collection_name=collection_name,
+        limit=SNAPSHOT_PAGE_SIZE,
+        with_payload=True,
+        with_vectors=True
+    )
+    while next_offset is not None:
+        page, next_offset = client.scroll(
+            collection_name=collection_name,
+            limit=SNAPSHOT_PAGE_SIZE,
+            offset=next_offset,
+            with_payload=True,
+            with_vectors=True
+        )
+        points.extend(page)
+    return points
+
+
+def get_collection_snapshot(collection_name, vector_names):
+    """
+    Return all points of a collection with pre-normalized vectors (cached).
+
+    The scroll runs under a per-collection lock only, so a reload of one
+    collection does not block readers of the other.
+
+    Args:
+        collection_name: Qdrant collection to scroll
+        vector_names: Named vectors in priority order; the first one present is used
+
+    Returns:
+        dict with 'points', 'vectors' (float32, L2-normalized), 'vector_name'
+        and 'paper_ids' (str ndarray), or None if the collection is empty
+    """
+    with _snapshot_lock:
+        snapshot = _snapshots.get(collection_name)
+        if snapshot and time.time() - snapshot['loaded_at'] < SNAPSHOT_TTL:
+            return snapshot
+        load_lock = _snapshot_load_locks.setdefault(collection_name, threading.Lock())
+
+    with load_lock:
+        # Another thread may have reloaded it while we waited
+        with _snapshot_lock:
+            snapshot = _snapshots.get(collection_name)
+            if snapshot and time.time() - snapshot['loaded_at'] < SNAPSHOT_TTL:
+                return snapshot
+
+        client, _ = get_qdrant_client()
+        points = _scroll_all_points(client, collection_name)
+        if not points:
+            with _snapshot_lock:
+                _snapshots.pop(collection_name, None)
+            return None
+
+        if isinstance(points[0].vector, dict):
+            vector_name = next((n for n in vector_names if n in points[0].vector), vector_names[-1])
+            vectors = np.array([p.vector[vector_name] for p in points], dtype=np.float32)
+        else:
+            # Handle case where vector might not be a dict (backward compatibility)
+            vector_name = "default"
+            vectors = np.array([p.vector for p in points], dtype=np.float32)
+
+        for p in points:
+            p.vector = None  # keep only the matrix copy
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        snapshot = {
+            'loaded_at': time.time(),
+            'points': points,
+            'vectors': vectors / norms,
+            'vector_name': vector_name,
+            'paper_ids': np.array([str(p.payload.get('paper_id', '')) for p in points]),
+        }
+        with _snapshot_lock:
+            _snapshots[collection_name] = snapshot
+        return snapshot
+
+
+def clear_collection_snapshots():
+    """Drop cached snapshots (e.g. after re-indexing)."""
+    with _snapshot_lock:
+        _snapshots.clear()
+
+
+def _normalize_query(query_vec):
+    query_vec = np.asarray(query_vec, dtype=np.float32)
+    norm = np.linalg.norm(query_vec)
+    return query_vec / norm if norm > 0 else query_vec
+
+
 def translate_query(query):
     """Translate Japanese query to English using MedGemma via Ollama."""
     if not re.search(r'[\u3040-\u30FF\u4E00-\u9FFF]', query):
@@ -359,50 +526,23 @@ def calculate_keyword_bonus(paper, keywords):
 
 def search_by_vector_similarity(query_vec, collection_name, limit=10, query=None):
     """Search by manual vector similarity with 2-stage reranking"""
-    global client, qdrant_mode
-    
-    # Lazy initialization of Qdrant client
-    if client is None:
-        client, qdrant_mode = initialize_qdrant_client(force_cloud=True)
-    
     logger = logging.getLogger()
     logger.info(f"  Fetching all points from {collection_name}...")
     
     try:
-        # Fetch all points from Qdrant
-        scroll_result = client.scroll(
-            collection_name=collection_name,
-            limit=10000,
-            with_payload=True,
-            with_vectors=True
-        )
-        
-        all_points = scroll_result[0]
-        logger.info(f"  ✓ Fetched {len(all_points)} points from {collection_name}")
-        
-        if not all_points:
+        # All points of the collection (cached snapshot, refreshed every SNAPSHOT_TTL s)
+        snapshot = get_collection_snapshot(
+            collection_name,
+            vector_names=('e5_pico', 'e5_questions_en', 'sapbert_pico'))
+        if snapshot is None:
             return []
-        
-        # Extract vectors and payloads based on available vectors
-        if all_points[0].vector and isinstance(all_points[0].vector, dict):
-            if 'e5_pico' in all_points[0].vector:
-                vectors = np.array([point.vector['e5_pico'] for point in all_points])
-                vector_name = "e5_pico"
-            elif 'e5_questions_en' in all_points[0].vector:
-                vectors = np.array([point.vector['e5_questions_en'] for point in all_points])
-                vector_name = "e5_questions_en"
-            else:
-                vectors = np.array([point.vector['sapbert_pico'] for point in all_points])
-                vector_name = "sapbert_pico"
-        else:
-            # Handle case where vector might not be a dict (backward compatibility)
-            vectors = np.array([point.vector for point in all_points])
-            vector_name = "default"
-        
-        logger.info(f"  Using {vector_name} vectors ({vectors.shape[1]}-dim)")
+        all_points = snapshot['points']
+        vectors = snapshot['vectors']
+        logger.info(f"  ✓ Fetched {len(all_points)} points from {collection_name}")
+        logger.info(f"  Using {snapshot['vector_name']} vectors ({vectors.shape[1]}-dim)")
         
         # Stage 1: Calculate cosine similarity
-        similarities = cosine_similarity([query_vec], vectors)[0]
+        similarities = vectors @ _normalize_query(query_vec)
         
         # Stage 2: Keyword-based reranking
         if query:
@@ -421,7 +561,7 @@ def search_by_vector_similarity(query_vec, collection_name, limit=10, query=None
                     
                     paper = {
                         'json_path': point.payload.get('json_path', ''),
-                        'paper_id': point.payload.get('paper_id', ''),
+                        'paper_id': str(point.payload.get('paper_id', '')),
                         'score': float(base_score),
                         'pico_en': point.payload.get('pico_en', {}),
                         'metadata': point.payload.get('metadata', {}),
@@ -456,7 +596,7 @@ def search_by_vector_similarity(query_vec, collection_name, limit=10, query=None
             
             results.append({
                 'json_path': point.payload.get('json_path', ''),
-                'paper_id': point.payload.get('paper_id', ''),
+                'paper_id': str(point.payload.get('paper_id', '')),
                 'score': float(score),
                 'pico_en': point.payload.get('pico_en', {}),
                 'metadata': point.payload.get('metadata', {}),
@@ -516,52 +656,37 @@ def search_medical_papers(query, top_k=10):
     }
 
 
-def search_atomic_facts(query, limit=5, paper_ids=None, progress_cb=None):
+def search_atomic_facts(query, limit=5, paper_ids=None, progress_cb=None, query_vec=None):
     """
     Search atomic facts collection by vector similarity
     CRITICAL FIX: Strictly filters by paper_ids if provided to avoid noise.
+    query_vec: precomputed SapBERT query embedding (skips the endpoint call)
     """
-    global client, qdrant_mode
-    
-    # Lazy initialization of Qdrant client
-    if client is None:
-        client, qdrant_mode = initialize_qdrant_client(force_cloud=True)
-    
     logger = logging.getLogger()
     logger.info(f"Searching atomic_facts...")
     
     # Generate Query Vector using HF Dedicated Endpoint (SapBERT)
-    query_vec = encode_via_hf_dedicated(query, progress_cb=progress_cb)
-    query_vec = np.array(query_vec)
+    if query_vec is None:
+        query_vec = encode_via_hf_dedicated(query, progress_cb=progress_cb)
     
     try:
-        # Fetch atomic facts
-        scroll_result = client.scroll(
-            collection_name="atomic_facts",
-            limit=2000, # Increased limit to ensure we find facts for specific papers
-            with_payload=True,
-            with_vectors=True
-        )
-        
-        all_facts = scroll_result[0]
-        logger.info(f"  ✓ Fetched {len(all_facts)} atomic facts total")
-        
-        if not all_facts:
+        # Fetch atomic facts (cached snapshot of the whole collection, so facts of every paper are found)
+        snapshot = get_collection_snapshot("atomic_facts", vector_names=('sapbert_fact',))
+        if snapshot is None:
             return []
+        all_facts = snapshot['points']
+        vectors = snapshot['vectors']
+        logger.info(f"  ✓ Fetched {len(all_facts)} atomic facts total")
         
         # --- FILTERING LOGIC ---
         if paper_ids:
             # Normalize paper_ids to strings for comparison
-            target_ids = set(str(pid) for pid in paper_ids)
-            logger.info(f"  ⚠ Filtering for papers: {target_ids}")
-            
-            filtered_facts = []
-            for f in all_facts:
-                fact_pid = str(f.payload.get('paper_id', ''))
-                if fact_pid in target_ids:
-                    filtered_facts.append(f)
+            target_ids = [str(pid) for pid in paper_ids]
+            logger.info(f"  ⚠ Filtering for papers: {set(target_ids)}")
             
-            all_facts = filtered_facts
+            indices = np.flatnonzero(np.isin(snapshot['paper_ids'], target_ids))
+            all_facts = [all_facts[i] for i in indices]
+            vectors = vectors[indices]
             logger.info(f"  ✓ Filtered down to {len(all_facts)} facts belonging to target papers")
             
             # If no facts found for these papers, return empty list (better than returning noise)
@@ -570,14 +695,8 @@ def search_atomic_facts(query, limit=5, paper_ids=None, progress_cb=None):
                 return []
         # -----------------------
 
-        # Extract vectors
-        if isinstance(all_facts[0].vector, dict):
-            vectors = np.array([fact.vector['sapbert_fact'] for fact in all_facts])
-        else:
-            vectors = np.array([fact.vector for fact in all_facts])
-            
         # Calculate similarity
-        similarities = cosine_similarity([query_vec], vectors)[0]
+        similarities = vectors @ _normalize_query(query_vec)
         
         # Sort
         top_indices = np.argsort(similarities)[::-1][:limit]
@@ -589,7 +708,7 @@ def search_atomic_facts(query, limit=5, paper_ids=None, progress_cb=None):
 
             results.append({
                 'json_path': fact.payload.get('json_path', ''),
-                'paper_id': fact.payload.get('paper_id', ''),
+                'paper_id': str(fact.payload.get('paper_id', '')),
                 'fact_text': fact.payload.get('fact_text', ''),
                 'score': float(score)
             })
@@ -606,6 +725,25 @@ def search_atomic_facts(query, limit=5, paper_ids=None, progress_cb=None):
         logger.info(f"  ✗ Error in search_atomic_facts: {e}")
         return []
 
+def search_papers_and_facts(query, top_k=3, fact_limit=10, progress_cb=None):
+    """
+    Paper search (E5) + atomic-fact search (SapBERT) for one English query.
+    The two query embeddings come from different endpoints, so the paper
+    search runs on a helper thread while SapBERT is encoded here; facts are
+    then ranked within the retrieved papers.
+
+    Returns:
+        (papers, facts)
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        papers_future = executor.submit(search_medical_papers, query, top_k)
+        fact_vec = encode_via_hf_dedicated(query, progress_cb=progress_cb)
+        papers = papers_future.result().get('papers', [])
+
+    paper_ids = [p.get('paper_id') for p in papers]
+    facts = search_atomic_facts(query, limit=fact_limit, paper_ids=paper_ids, query_vec=fact_vec)
+    return papers, facts
+
 if __name__ == '__main__':
     # CLI interface with argument parsing
     parser = argparse.ArgumentParser(description='Search medical papers using Qdrant')
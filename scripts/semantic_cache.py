@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Semantic answer cache for /api/query
+Stores the SSE events of completed answers keyed by the query embedding and
+replays them for near-duplicate questions (cosine similarity >= threshold).
+- Embeddings are L2-normalized, so cosine similarity is a plain dot product
+- Separate namespace per mode and query language (e.g. rag:ja, compare:en)
+- Entries expire after ttl_seconds, like the retrieval cache
+- One fixed vector per stored answer (the vector of the query the answer was
+  generated for; never averaged with later queries)
+- Bounded size with LRU+frequency eviction: psi = alpha*f_u + (1-alpha)*exp(-t/beta)
+"""
+
+import math
+import threading
+import time
+
+import numpy as np
+
+
+class SemanticCache:
+    """Thread-safe, bounded semantic cache of replayable SSE events."""
+
+    def __init__(self, threshold=0.95, max_entries=500, alpha=0.6, beta=3600.0, ttl_seconds=600):
+        """
+        Args:
+            threshold: Minimum cosine similarity for a cache hit
+            max_entries: Maximum number of stored answers per namespace
+            alpha: Weight of access frequency in the eviction score
+            beta: Recency decay constant in seconds
+            ttl_seconds: Lifetime of a cached answer in seconds
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.alpha = alpha
+        self.beta = beta
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._namespaces = {}  # namespace -> {'vectors': ndarray, 'entries': [dict]}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(embedding):
+        vec = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def lookup(self, namespace, embedding):
+        """
+        Find cached events for a semantically equivalent query.
+
+        Returns:
+            list of SSE payload dicts, or None on a miss
+        """
+        query_vec = self._normalize(embedding)
+        with self._lock:
+            store = self._namespaces.get(namespace)
+            if store:
+                self._expire(store)
+            if not store or not store['entries']:
+                self.misses += 1
+                return None
+
+            similarities = store['vectors'] @ query_vec
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entry = store['entries'][best]
+            entry['hits'] += 1
+            entry['last_access'] = time.time()
+            self.hits += 1
+            return list(entry['events'])
+
+    def insert(self, namespace, embedding, events):
+        """
+        Store the SSE events of a completed answer.
+
+        Skipped if an equivalent entry (similarity >= threshold) was stored
+        meanwhile by a concurrent request for the same question.
+        """
+        vec = self._normalize(embedding)
+        now = time.time()
+        with self._lock:
+            store = self._namespaces.setdefault(
+                namespace, {'vectors': np.empty((0, vec.shape[0]), dtype=np.float32), 'entries': []}
+            )
+
+            self._expire(store)
+            if store['entries']:
+                similarities = store['vectors'] @ vec
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    return
+
+            if len(store['entries']) >= self.max_entries:
+                self._evict(store, now)
+
+            store['entries'].append({
+                'events': list(events), 'hits': 1, 'last_access': now,
+                'expires_at': time.monotonic() + self.ttl_seconds,
+            })
+            store['vectors'] = np.vstack([store['vectors'], vec[np.newaxis, :]])
+
+    @staticmethod
+    def _expire(store):
+        """Drop entries past their TTL (caller holds the lock)."""
+        now = time.monotonic()
+        alive = [i for i, e in enumerate(store['entries']) if e['expires_at'] >= now]
+        if len(alive) < len(store['entries']):
+            store['entries'] = [store['entries'][i] for i in alive]
+            store['vectors'] = store['vectors'][alive]
+
+    def _evict(self, store, now):
+        """Drop the entry with the lowest psi score (caller holds the lock)."""
+        entries = store['entries']
+        max_hits = max(e['hits'] for e in entries)
+        scores = [
+            self.alpha * (e['hits'] / max_hits)
+            + (1 - self.alpha) * math.exp(-(now - e['last_access']) / self.beta)
+            for e in entries
+        ]
+        victim = int(np.argmin(scores))
+        del entries[victim]
+        store['vectors'] = np.delete(store['vectors'], victim, axis=0)
+
+    def clear(self):
+        with self._lock:
+            self._namespaces.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': {ns: len(s['entries']) for ns, s in self._namespaces.items()},
+                'hits': self.hits,
+                'misses': self.misses,
+            }
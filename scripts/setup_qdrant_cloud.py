@@ -5,7 +5,10 @@ Qdrant Cloudのコレクションを削除し、再作成する
 """
 
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
+from qdrant_client.models import (
+    Distance, VectorParams,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType
+)
 import os
 import sys
 from dotenv import load_dotenv
@@ -64,6 +67,12 @@ def delete_collections(client):
                 print(f"  Error deleting {collection_name}: {e}")
 
 
+# int8 scalar quantization (same as generate_embeddings.setup_collections)
+QUANTIZATION_CONFIG = ScalarQuantization(
+    scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+)
+
+
 def create_collections(client):
     """Create new collections with proper vector configurations"""
     print("\n" + "="*70)
@@ -76,20 +85,22 @@ def create_collections(client):
         collection_name="medical_papers",
         vectors_config={
             # SapBERT: Medical concept understanding (English PICO)
-            "sapbert_pico": VectorParams(size=768, distance=Distance.COSINE),
+            "sapbert_pico": VectorParams(size=768, distance=Distance.COSINE, on_disk=True),
             
             # multilingual-e5: PICO (language-agnostic)
-            "e5_pico": VectorParams(size=1024, distance=Distance.COSINE),
+            "e5_pico": VectorParams(size=1024, distance=Distance.COSINE, on_disk=True),
             
             # multilingual-e5: English question matching (average)
-            "e5_questions_en": VectorParams(size=1024, distance=Distance.COSINE)
-        }
+            "e5_questions_en": VectorParams(size=1024, distance=Distance.COSINE, on_disk=True)
+        },
+        quantization_config=QUANTIZATION_CONFIG
     )
     print("✓ Created collection: medical_papers")
     print("  Vectors:")
     print("    - sapbert_pico: 768-dim (COSINE)")
     print("    - e5_pico: 1024-dim (COSINE)")
     print("    - e5_questions_en: 1024-dim (COSINE)")
+    print("  Quantization: int8 scalar (always_ram), originals on disk")
     
     # atomic_facts collection
     print("\nCreating atomic_facts collection...")
@@ -97,8 +108,9 @@ def create_collections(client):
         collection_name="atomic_facts",
         vectors_config={
             # SapBERT: Medical concept understanding (atomic facts)
-            "sapbert_fact": VectorParams(size=768, distance=Distance.COSINE)
-        }
+            "sapbert_fact": VectorParams(size=768, distance=Distance.COSINE, on_disk=True)
+        },
+        quantization_config=QUANTIZATION_CONFIG
     )
     print("✓ Created collection: atomic_facts")
     print("  Vectors:")
@@ -13,6 +13,7 @@ import time
 from pathlib import Path
 from openai import OpenAI
 from dotenv import load_dotenv
+from constants import SUBSECTIONS
 
 # Load environment variables
 load_dotenv()
@@ -540,12 +541,6 @@ def main():
         print(f"Invalid domain: {domain}")
         return
     
-    # Validate subsection
-    SUBSECTIONS = {
-        'pharmacologic': ['glp1_receptor_agonists', 'guidelines_and_reviews', 'novel_agents'],
-        'surgical': ['procedures_and_outcomes', 'metabolic_effects', 'complications_safety'],
-        'lifestyle': ['dietary_interventions', 'physical_activity', 'behavioral_therapy']
-    }
     if subsection not in SUBSECTIONS.get(domain, []):
         print(f"Invalid subsection for {domain}: {subsection}")
         print(f"Valid subsections: {SUBSECTIONS[domain]}")
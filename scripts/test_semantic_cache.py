@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test the semantic answer cache of /api/query (no network: translation,
+embedding, retrieval and MedGemma calls are replaced in-process)
+Tests that:
+1. A repeated question in the same language is replayed from the cache
+2. A Japanese question whose translation matches a cached English question
+   is not answered with the English-only events (and vice versa)
+"""
+
+import hashlib
+import os
+import sys
+
+import numpy as np
+import orjson
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as web  # noqa: E402
+
+QUESTION_EN = "Does semaglutide reduce body weight?"
+QUESTION_JA = "セマグルチドは体重を減らしますか？"
+
+
+def _fake_embedding(text):
+    seed = int(hashlib.sha1(text.encode('utf-8')).hexdigest()[:8], 16)
+    return np.random.default_rng(seed).standard_normal(16).astype(np.float32)
+
+
+def _install_fakes():
+    web.medgemma_query.translate_query = lambda q, debug=False: QUESTION_EN if web.JAPANESE_RE.search(q) else q
+    web.medgemma_query.translate_to_japanese = lambda text: "日本語訳: " + text
+    web.medgemma_query.synthesize_findings = lambda findings, query, progress_cb=None: "English answer."
+    web.search_qdrant.encode_via_openrouter = _fake_embedding
+    web.search_qdrant.search_papers_and_facts = lambda q, top_k=3, fact_limit=10, progress_cb=None: ([], [])
+    web.SEMANTIC_CACHE.clear()
+    web.RETRIEVAL_CACHE.clear()
+
+
+def _ask(client, query, mode='rag'):
+    """POST /api/query and return the non-progress SSE event types."""
+    body = client.post('/api/query', json={'query': query, 'mode': mode}).get_data()
+    events = [orjson.loads(frame[len(b'data: '):]) for frame in body.split(b'\n\n') if frame.startswith(b'data: ')]
+    return [e['type'] for e in events if e['type'] != 'progress']
+
+
+def test_same_language_hit():
+    """Test that a repeated English question is served from the cache"""
+    print("Test 1: Same-language repeat hits the semantic cache")
+    _install_fakes()
+    client = web.app.test_client()
+    first = _ask(client, QUESTION_EN)
+    hits_before = web.SEMANTIC_CACHE.hits
+    second = _ask(client, QUESTION_EN)
+    assert web.SEMANTIC_CACHE.hits == hits_before + 1, "Expected a cache hit for the repeated question"
+    assert second == first, f"Replayed events differ: {second} != {first}"
+    print("✓ Repeated question replayed from the cache\n")
+
+
+def test_mixed_language_miss():
+    """Test that cached answers are not shared between Japanese and English questions"""
+    print("Test 2: Japanese / English questions with the same translation")
+    _install_fakes()
+    client = web.app.test_client()
+
+    english = _ask(client, QUESTION_EN)
+    japanese = _ask(client, QUESTION_JA)
+    assert 'translation' not in english, f"English answer carries a translation: {english}"
+    assert 'translation' in japanese, f"Japanese question got no Japanese translation: {japanese}"
+
+    # Reverse order: the cached Japanese answer must not be replayed to an English user
+    _install_fakes()
+    japanese = _ask(client, QUESTION_JA)
+    english = _ask(client, QUESTION_EN)
+    assert 'translation' in japanese, f"Japanese question got no Japanese translation: {japanese}"
+    assert 'translation' not in english, f"English question got a Japanese translation: {english}"
+    print("✓ Each language gets its own cached answer\n")
+
+
+if __name__ == "__main__":
+    print("=" * 70)
+    print("Testing Semantic Answer Cache")
+    print("=" * 70 + "\n")
+
+    try:
+        test_same_language_hit()
+        test_mixed_language_miss()
+
+        print("=" * 70)
+        print("All tests passed!")
+        print("=" * 70)
+
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        exit(1)
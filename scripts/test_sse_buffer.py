@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Test SSE frame coalescing on /api/query (no network: MedGemma streaming is
+replaced in-process)
+Tests that:
+1. A token followed by a long MedGemma pause is sent after ~SSE_FLUSH_DELAY,
+   without waiting for the next token or the final done event
+2. All tokens still arrive in order
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app as web  # noqa: E402
+
+PAUSE_SECONDS = 1.0
+
+
+def _slow_stream(prompt):
+    """MedGemma stand-in: one token, a long pause, then the rest"""
+    yield "Hello"
+    time.sleep(PAUSE_SECONDS)
+    yield " world"
+
+
+def test_lone_token_flushed_during_pause():
+    """Test that a buffered token is flushed while upstream is idle"""
+    print("Test 1: Lone token is emitted during a MedGemma pause")
+    web.stream_ollama = _slow_stream
+    client = web.app.test_client()
+
+    start = time.monotonic()
+    resp = client.post('/api/query', json={'query': 'Is metformin safe?', 'mode': 'direct'}, buffered=False)
+    first_token_at = None
+    body = b''
+    for chunk in resp.response:
+        body += chunk
+        if first_token_at is None and b'"Hello"' in body:
+            first_token_at = time.monotonic() - start
+    resp.close()
+
+    assert first_token_at is not None, "First token never arrived"
+    assert first_token_at < PAUSE_SECONDS / 2, f"First token held for {first_token_at:.2f}s (until the next frame)"
+    assert body.index(b'"Hello"') < body.index(b'" world"') < body.index(b'"done"'), "Tokens out of order"
+    print(f"✓ First token sent after {first_token_at * 1000:.0f} ms, before the {PAUSE_SECONDS:.0f}s pause ended\n")
+
+
+if __name__ == "__main__":
+    print("=" * 70)
+    print("Testing SSE Buffer Flushing")
+    print("=" * 70 + "\n")
+
+    try:
+        test_lone_token_flushed_during_pause()
+
+        print("=" * 70)
+        print("All tests passed!")
+        print("=" * 70)
+
+    except AssertionError as e:
+        print(f"\n✗ Test failed: {e}")
+        exit(1)
@@ -7,6 +7,7 @@ Validates collections, data integrity, and runs test queries
 from qdrant_client import QdrantClient
 from pathlib import Path
 import json
+from qdrant_server import connect_qdrant_server
 
 
 def validate_qdrant_setup():
@@ -16,7 +17,7 @@ def validate_qdrant_setup():
     Returns:
         validation_results: dict with status of each check
     """
-    client = QdrantClient(path="./qdrant_medical_db")
+    client = connect_qdrant_server() or QdrantClient(path="./qdrant_medical_db")
     
     print("="*70)
     print("Qdrant Validation")
@@ -8,6 +8,7 @@ import json
 import sys
 from pathlib import Path
 from typing import Dict, List, Any
+from constants import SUBSECTIONS
 
 
 def validate_paper(paper_file: Path) -> Dict[str, Any]:
@@ -165,12 +166,6 @@ def validate_paper(paper_file: Path) -> Dict[str, Any]:
 def validate_domain(domain: str) -> Dict[str, Any]:
     """Validate all papers in a domain (all subsections)"""
     
-    SUBSECTIONS = {
-        'pharmacologic': ['glp1_receptor_agonists', 'guidelines_and_reviews', 'novel_agents'],
-        'surgical': ['procedures_and_outcomes', 'metabolic_effects', 'complications_safety'],
-        'lifestyle': ['dietary_interventions', 'physical_activity', 'behavioral_therapy']
-    }
-    
     if domain not in SUBSECTIONS:
         return {'error': f'Invalid domain: {domain}'}
     
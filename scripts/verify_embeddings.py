@@ -6,6 +6,11 @@ Quick health check for the Qdrant embedding database
 
 from qdrant_client import QdrantClient
 from pathlib import Path
+from constants import SUBSECTIONS
+from qdrant_server import connect_qdrant_server
+
+# Points per scroll request when paging through medical_papers
+SCROLL_PAGE_SIZE = 1024
 
 
 def verify_embeddings():
@@ -17,7 +22,7 @@ def verify_embeddings():
 
     # Initialize client
     try:
-        client = QdrantClient(path="./qdrant_medical_db")
+        client = connect_qdrant_server() or QdrantClient(path="./qdrant_medical_db")
     except Exception as e:
         print(f"❌ Failed to connect to Qdrant: {e}")
         return False
@@ -27,29 +32,40 @@ def verify_embeddings():
     print("-" * 70)
 
     try:
-        papers_result = client.scroll(
-            collection_name="medical_papers",
-            limit=10000,
-            with_payload=True,
-            with_vectors=True
-        )
-        papers = papers_result[0]
-
-        print(f"  Total points: {len(papers)}")
-
-        # Check unique PMIDs
+        # Page through paper_id payloads only (a single limit=10000 scroll silently
+        # dropped everything past 10k points and downloaded every vector)
+        n_papers = 0
         pmids = set()
-        for point in papers:
-            pmid = point.payload.get('paper_id', '')
-            if pmid:
-                pmids.add(pmid)
-
+        offset = None
+        while True:
+            page, offset = client.scroll(
+                collection_name="medical_papers",
+                limit=SCROLL_PAGE_SIZE,
+                offset=offset,
+                with_payload=["paper_id"],
+                with_vectors=False
+            )
+            n_papers += len(page)
+            for point in page:
+                pmid = point.payload.get('paper_id', '')
+                if pmid:
+                    pmids.add(pmid)
+            if offset is None:
+                break
+
+        print(f"  Total points: {n_papers}")
         print(f"  Unique PMIDs: {len(pmids)}")
 
-        if len(papers) != len(pmids):
-            print(f"  ⚠️  Warning: {len(papers) - len(pmids)} duplicate points")
+        if n_papers != len(pmids):
+            print(f"  ⚠️  Warning: {n_papers - len(pmids)} duplicate points")
 
         # Check sample paper for named vectors
+        papers, _ = client.scroll(
+            collection_name="medical_papers",
+            limit=1,
+            with_payload=True,
+            with_vectors=True
+        )
         if papers:
             sample = papers[0]
             vectors = sample.vector
@@ -84,21 +100,21 @@ def verify_embeddings():
     print("-" * 70)
 
     try:
-        facts_result = client.scroll(
-            collection_name="atomic_facts",
-            limit=10000,
-            with_payload=True,
-            with_vectors=True
-        )
-        facts = facts_result[0]
+        n_facts = client.count(collection_name="atomic_facts", exact=True).count
 
-        print(f"  Total points: {len(facts)}")
+        print(f"  Total points: {n_facts}")
 
         if len(pmids) > 0:
-            avg_facts = len(facts) / len(pmids)
+            avg_facts = n_facts / len(pmids)
             print(f"  Average per paper: {avg_facts:.1f}")
 
         # Check sample atomic fact
+        facts, _ = client.scroll(
+            collection_name="atomic_facts",
+            limit=1,
+            with_payload=True,
+            with_vectors=True
+        )
         if facts:
             sample_fact = facts[0]
             fact_vec = sample_fact.vector
@@ -124,12 +140,6 @@ def verify_embeddings():
     print("File System Comparison:")
     print("-" * 70)
     
-    SUBSECTIONS = {
-        'pharmacologic': ['glp1_receptor_agonists', 'guidelines_and_reviews', 'novel_agents'],
-        'surgical': ['procedures_and_outcomes', 'metabolic_effects', 'complications_safety'],
-        'lifestyle': ['dietary_interventions', 'physical_activity', 'behavioral_therapy']
-    }
-    
     domains = ['pharmacologic', 'surgical', 'lifestyle']
     total_files = 0
     
@@ -162,14 +172,14 @@ def verify_embeddings():
     print("="*70)
 
     status = "✓ HEALTHY" if (
-        len(papers) == total_files and
-        len(papers) == len(pmids) and
-        len(facts) > 0
+        n_papers == total_files and
+        n_papers == len(pmids) and
+        n_facts > 0
     ) else "⚠️  NEEDS ATTENTION"
 
     print(f"  Database status: {status}")
     print(f"  Papers: {len(pmids)}/{total_files}")
-    print(f"  Atomic facts: {len(facts)}")
+    print(f"  Atomic facts: {n_facts}")
     print("="*70 + "\n")
 
     return status == "✓ HEALTHY"